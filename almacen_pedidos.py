@@ -0,0 +1,168 @@
+# almacen_pedidos.py
+import os
+import json
+import sqlite3
+import hashlib
+from datetime import datetime, timedelta
+import streamlit as st
+from extraer_tabla import PEDIDO_NO_ENCONTRADO
+
+ALMACEN_PEDIDOS_DB = os.getenv("ALMACEN_PEDIDOS_DB", "pedidos.db")
+# Plantillas SaeGA (~2 MB cada una) que se conservan; en los pedidos más antiguos se descartan
+ALMACEN_PLANTILLAS_MAX = int(os.getenv("ALMACEN_PLANTILLAS_MAX", "200"))
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS pedidos (
+    id               INTEGER PRIMARY KEY AUTOINCREMENT,
+    pdf_hash         TEXT NOT NULL UNIQUE,   -- sha256 del PDF subido
+    pedido           TEXT,                   -- valor_pedido extraído de la primera tabla
+    tienda           TEXT,
+    nombre_pdf       TEXT,
+    fecha            TEXT NOT NULL,          -- ISO 8601, hora local
+    filas            TEXT NOT NULL,          -- JSON con las filas ordenadas (columnas COLUMNAS)
+    excel            BLOB,                   -- Factura_*.xlsx generado
+    excel_nombre     TEXT,
+    plantilla        BLOB,                   -- plantilla SaeGA .xlsm generada
+    subido_como      TEXT,                   -- nombre con el que se subió a SharePoint
+    fecha_subida     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_pedidos_pedido ON pedidos(pedido);
+CREATE INDEX IF NOT EXISTS idx_pedidos_tienda ON pedidos(tienda);
+CREATE INDEX IF NOT EXISTS idx_pedidos_fecha  ON pedidos(fecha);
+"""
+
+# Columnas que se devuelven en búsquedas (sin los BLOB, que se piden aparte)
+CAMPOS_RESUMEN = "pdf_hash, pedido, tienda, nombre_pdf, fecha, excel_nombre, subido_como, fecha_subida, " \
+                 "plantilla IS NOT NULL AS tiene_plantilla"
+
+
+def hash_pdf(pdf_bytes: bytes) -> str:
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+class AlmacenPedidos:
+    """
+    Registro persistente (SQLite) de los pedidos ya procesados: evita volver a
+    parsear un PDF conocido, permite buscar y descargar pedidos antiguos y
+    recuerda qué se subió ya a SharePoint.
+    """
+
+    def __init__(self, ruta_db: str = ALMACEN_PEDIDOS_DB, plantillas_max: int = ALMACEN_PLANTILLAS_MAX):
+        self.ruta_db = ruta_db
+        self.plantillas_max = plantillas_max
+        conn = self._conectar()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(ESQUEMA)
+        finally:
+            conn.close()
+
+    def _conectar(self) -> sqlite3.Connection:
+        # Una conexión por operación: las sesiones de Streamlit corren en hilos distintos
+        conn = sqlite3.connect(self.ruta_db, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ejecutar(self, sql: str, params: tuple = ()):
+        conn = self._conectar()
+        try:
+            with conn:
+                return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    # ---------- Escritura ----------
+    def guardar(self, pdf_hash: str, nombre_pdf: str, resultado: dict) -> None:
+        """Guarda el resultado de `convertir_pdf_pedido` (si el PDF ya existía, lo reemplaza)."""
+        self._ejecutar(
+            """
+            INSERT INTO pedidos (pdf_hash, pedido, tienda, nombre_pdf, fecha, filas, excel, excel_nombre)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(pdf_hash) DO UPDATE SET
+                pedido = excluded.pedido, tienda = excluded.tienda, nombre_pdf = excluded.nombre_pdf,
+                fecha = excluded.fecha, filas = excluded.filas,
+                excel = excluded.excel, excel_nombre = excluded.excel_nombre
+            """,
+            (
+                pdf_hash, resultado["pedido"], resultado["tienda"], nombre_pdf,
+                datetime.now().isoformat(timespec="seconds"),
+                json.dumps(resultado["filas"], ensure_ascii=False, default=str),
+                resultado["excel"], resultado["nombre"],
+            )
+        )
+
+    def guardar_plantilla(self, pdf_hash: str, plantilla_bytes: bytes) -> None:
+        self._ejecutar("UPDATE pedidos SET plantilla = ? WHERE pdf_hash = ?", (plantilla_bytes, pdf_hash))
+        # Retención: solo las `plantillas_max` más recientes (SQLite reutiliza el espacio liberado)
+        self._ejecutar(
+            """
+            UPDATE pedidos SET plantilla = NULL
+            WHERE plantilla IS NOT NULL AND id NOT IN (
+                SELECT id FROM pedidos WHERE plantilla IS NOT NULL ORDER BY fecha DESC, id DESC LIMIT ?
+            )
+            """,
+            (self.plantillas_max,)
+        )
+
+    def marcar_subido(self, pdf_hash: str, nombre_archivo: str) -> None:
+        self._ejecutar(
+            "UPDATE pedidos SET subido_como = ?, fecha_subida = ? WHERE pdf_hash = ?",
+            (nombre_archivo, datetime.now().isoformat(timespec="seconds"), pdf_hash)
+        )
+
+    # ---------- Lectura ----------
+    def obtener(self, pdf_hash: str):
+        """Devuelve el pedido completo (dict, con filas y artefactos) o None si no se conoce."""
+        filas = self._ejecutar("SELECT * FROM pedidos WHERE pdf_hash = ?", (pdf_hash,))
+        if not filas:
+            return None
+        pedido = dict(filas[0])
+        pedido["filas"] = json.loads(pedido["filas"])
+        return pedido
+
+    def buscar(self, pedido: str = None, tienda: str = None, desde=None, hasta=None, limite: int = 50) -> list:
+        """Búsqueda por pedido/tienda (igualdad) y rango de fechas; los más recientes primero."""
+        condiciones, params = [], []
+        if pedido:
+            condiciones.append("pedido = ?")
+            params.append(pedido.strip())
+        if tienda:
+            condiciones.append("tienda = ?")
+            params.append(tienda.strip())
+        if desde:
+            condiciones.append("fecha >= ?")
+            params.append(desde.isoformat())
+        if hasta:
+            # `hasta` incluye el día completo
+            condiciones.append("fecha < ?")
+            params.append((hasta + timedelta(days=1)).isoformat())
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        filas = self._ejecutar(
+            f"SELECT {CAMPOS_RESUMEN} FROM pedidos {where} ORDER BY fecha DESC LIMIT ?",
+            (*params, limite)
+        )
+        return [dict(f) for f in filas]
+
+    def obtener_subida(self, pdf_hash: str):
+        """Nombre con el que se subió a SharePoint el pedido de este PDF, o None."""
+        filas = self._ejecutar("SELECT subido_como FROM pedidos WHERE pdf_hash = ?", (pdf_hash,))
+        return filas[0][0] if filas else None
+
+    def subidas_previas(self, pdf_hash: str, pedido: str) -> list:
+        """Subidas a SharePoint del mismo número de pedido hechas desde otros PDFs."""
+        if not pedido or pedido == PEDIDO_NO_ENCONTRADO:
+            return []  # sin número de pedido no se puede saber si es el mismo
+        return [p for p in self.buscar(pedido=pedido) if p["subido_como"] and p["pdf_hash"] != pdf_hash]
+
+    def obtener_artefacto(self, pdf_hash: str, tipo: str):
+        """Bytes del 'excel' o de la 'plantilla' guardados para el PDF, o None."""
+        if tipo not in ("excel", "plantilla"):
+            raise ValueError(f"Artefacto desconocido: {tipo}")
+        filas = self._ejecutar(f"SELECT {tipo} FROM pedidos WHERE pdf_hash = ?", (pdf_hash,))
+        return filas[0][0] if filas else None
+
+
+@st.cache_resource
+def obtener_almacen() -> AlmacenPedidos:
+    """Almacén único por servidor, compartido por todas las sesiones de Streamlit."""
+    return AlmacenPedidos()
@@ -2,6 +2,8 @@ import streamlit as st
 from auth import procesar_callback, cerrar_sesion
 from ui import mostrar_login, render_header, render_footer, mostrar_aplicacion
 from cron import iniciar_cron
+from metricas import iniciar_exportacion
+from servicio_http import iniciar_en_app
 
 def main():
     # El callback de autenticación se procesa primero
@@ -16,4 +18,6 @@ def main():
 
 if __name__ == "__main__":
     iniciar_cron()
+    iniciar_exportacion()
+    iniciar_en_app()
     main()
@@ -3,6 +3,8 @@ from dotenv import load_dotenv
 import streamlit as st
 import streamlit.components.v1 as components
 import msal
+import time
+from metricas import LOGINS, ETAPA_DURACION
 
 load_dotenv()
 
@@ -46,21 +48,25 @@ def procesar_callback() -> bool:
     if isinstance(code, list):
         code = code[0]
 
+    inicio = time.perf_counter()
     result = st.session_state.msal_app.acquire_token_by_authorization_code(
         code,
         scopes=SCOPES,
         redirect_uri=REDIRECT_URI
     )
+    ETAPA_DURACION.observar(time.perf_counter() - inicio, etapa="token")
 
     if "access_token" in result:
         user_claims = result.get("id_token_claims", {})
         user_groups = user_claims.get("groups") or []
 
         if ALLOWED_GROUP_ID not in user_groups:
+            LOGINS.inc(resultado="denegado")
             st.error("❌ No tienes permisos para acceder a esta aplicación.")
             return True  # Detiene el flujo y evita mostrar la app
 
         # Si está en el grupo permitido, guarda sesión
+        LOGINS.inc(resultado="ok")
         st.session_state.access_token = result["access_token"]
         st.session_state.user_info    = user_claims
 
@@ -69,6 +75,7 @@ def procesar_callback() -> bool:
         st.rerun()
         return True
 
+    LOGINS.inc(resultado="error")
     st.error(f"❌ No se pudo obtener el token:\n{result.get('error_description')}")
     return False
 
@@ -0,0 +1,213 @@
+# benchmarks/carga_sesiones.py
+"""
+Prueba de carga de sesiones concurrentes contra un Microsoft Graph simulado.
+
+Es una aproximación de `mostrar_aplicacion` tras el login (que se omite: cada sesión
+usa un token ficticio propio). Los widgets de Streamlit, y en particular el
+file_uploader, no se pueden manejar desde un script, así que cada sesión encadena
+los mismos componentes que usa la UI, en el mismo orden:
+    conversion   → almacén de pedidos por hash del PDF; si no está, trabajo
+                   `convertir_pdf_pedido` en la cola (PDF + Orden Maestra vía Graph)
+                   y se guarda en el almacén
+    vista_previa → lectura del Excel generado con pandas
+    plantilla    → caché de plantillas (cache_salidas); si falla y se pasa --plantilla,
+                   limpiar/volcar la plantilla SaeGA con xlwings (necesita Excel)
+    subida       → comprobación de subidas previas del almacén, `subir_a_sharepoint`
+                   y registro de la subida
+El almacén y la caché se crean en un directorio temporal. Por defecto cada iteración
+sube un PDF distinto (se le añade un comentario tras %%EOF) para que la conversión no
+sea siempre un acierto del almacén; --mismo-pdf mide justo ese caso.
+
+Una conversión cuya Orden Maestra no se pudo leer (p. ej. por un 429 del Graph
+simulado) cuenta como error: la UI la muestra con un aviso y las líneas sin ordenar.
+
+Al final muestra p50/p95/p99 por etapa, el rendimiento global y el tráfico que
+ha recibido el Graph simulado (incluidos los 429 por throttling).
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.carga_sesiones pedido.pdf --sesiones 10 --iteraciones 3 \\
+        --latencia 0.1 --limite-rps 50 --workers 4
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+from io import BytesIO
+from collections import defaultdict
+from graph_simulado import ConfigSimulacion, iniciar_en_segundo_plano
+
+ETAPAS = ("conversion", "vista_previa", "plantilla", "subida", "total")
+
+
+def percentil(valores: list, p: float) -> float:
+    ordenados = sorted(valores)
+    if not ordenados:
+        return float("nan")
+    k = (len(ordenados) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(ordenados) - 1)
+    return ordenados[i] + (ordenados[j] - ordenados[i]) * (k - i)
+
+
+class Resultados:
+    def __init__(self):
+        self.tiempos = defaultdict(list)
+        self.errores = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def registrar(self, etapa: str, segundos: float):
+        with self._lock:
+            self.tiempos[etapa].append(segundos)
+
+    def fallo(self, etapa: str):
+        with self._lock:
+            self.errores[etapa] += 1
+
+
+def sesion(n: int, iteraciones: int, pdf_bytes: bytes, nombre_pdf: str, opciones: argparse.Namespace,
+           gestor, almacen, cache, resultados: Resultados):
+    # Importaciones diferidas: deben hacerse después de fijar GRAPH_URL
+    import pandas as pd
+    from trabajos import convertir_pdf_pedido, COMPLETADO
+    from exportacion_plantilla import subir_a_sharepoint, RUTA_PLANTILLA, COLUMNAS_PLANTILLA
+    from almacen_pedidos import hash_pdf
+    from cache_salidas import hash_filas_excel
+
+    access_token = f"sesion-{n}"  # login omitido
+    # Copia propia de la plantilla: xlwings la reescribe en el sitio
+    ruta_plantilla = os.path.join(tempfile.mkdtemp(), f"plantilla_{n}.xlsm")
+    shutil.copy(RUTA_PLANTILLA, ruta_plantilla)
+
+    for it in range(iteraciones):
+        inicio_total = time.perf_counter()
+        etapa = "conversion"
+        try:
+            t0 = time.perf_counter()
+            pdf_sesion = pdf_bytes if opciones.mismo_pdf else pdf_bytes + f"\n% sesion {n} iteracion {it}\n".encode()
+            pdf_hash = hash_pdf(pdf_sesion)
+            guardado = almacen.obtener(pdf_hash)
+            if guardado is not None and guardado["excel"]:
+                bytes_data, pedido = guardado["excel"], guardado["pedido"]
+            else:
+                trabajo = gestor.esperar(gestor.enviar(convertir_pdf_pedido, pdf_sesion, nombre_pdf, access_token))
+                if trabajo.estado != COMPLETADO:
+                    raise RuntimeError(trabajo.error or trabajo.estado)
+                if trabajo.resultado["aviso"]:
+                    raise RuntimeError(trabajo.resultado["aviso"])
+                almacen.guardar(pdf_hash, nombre_pdf, trabajo.resultado)
+                bytes_data, pedido = trabajo.resultado["excel"], trabajo.resultado["pedido"]
+            resultados.registrar(etapa, time.perf_counter() - t0)
+
+            etapa = "vista_previa"
+            t0 = time.perf_counter()
+            pd.read_excel(BytesIO(bytes_data))
+            resultados.registrar(etapa, time.perf_counter() - t0)
+
+            etapa = "plantilla"
+            t0 = time.perf_counter()
+            base_plantilla = cache.base_plantilla(ruta_plantilla)
+            clave_cache = cache.clave(base_plantilla, hash_filas_excel(bytes_data, COLUMNAS_PLANTILLA))
+            plantilla_bytes = cache.obtener(clave_cache)
+            if plantilla_bytes is None and opciones.plantilla:
+                from exportacion_plantilla import limpiar_entradas_xlwings, exportar_directo_excel_xlwings
+                limpiar_entradas_xlwings(ruta_plantilla, ajustar_filas=True)
+                exportar_directo_excel_xlwings(ruta_plantilla, bytes_data, columnas_df=COLUMNAS_PLANTILLA)
+                with open(ruta_plantilla, "rb") as f:
+                    plantilla_bytes = f.read()
+                cache.guardar(clave_cache, plantilla_bytes, base_plantilla)
+            elif plantilla_bytes is None:
+                plantilla_bytes = bytes_data  # sin Excel: se sube el Factura en lugar de la plantilla
+            almacen.guardar_plantilla(pdf_hash, plantilla_bytes)
+            resultados.registrar(etapa, time.perf_counter() - t0)
+
+            etapa = "subida"
+            t0 = time.perf_counter()
+            nombre_archivo = f"{n:03d}{it:03d} - SaeGA.xlsm"
+            # Como subida_permitida: no se repite la misma subida. La consulta de subidas del
+            # mismo pedido desde otros PDFs se hace igual; la confirmación se da siempre por buena
+            almacen.subidas_previas(pdf_hash, pedido)
+            if almacen.obtener_subida(pdf_hash) != nombre_archivo:
+                if not subir_a_sharepoint(BytesIO(plantilla_bytes), nombre_archivo, access_token):
+                    raise RuntimeError("subida fallida")
+                almacen.marcar_subido(pdf_hash, nombre_archivo)
+            resultados.registrar(etapa, time.perf_counter() - t0)
+
+            resultados.registrar("total", time.perf_counter() - inicio_total)
+        except Exception as e:
+            print(f"  ⚠️ sesión {n}, iteración {it}, etapa {etapa}: {e}", file=sys.stderr)
+            resultados.fallo(etapa)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", help="PDF de pedido de ejemplo")
+    parser.add_argument("--sesiones", type=int, default=10, help="sesiones concurrentes")
+    parser.add_argument("--iteraciones", type=int, default=3, help="PDFs procesados por sesión")
+    parser.add_argument("--workers", type=int, default=None, help="procesos del pool de trabajos")
+    parser.add_argument("--latencia", type=float, default=0.1, help="latencia del Graph simulado (s)")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--limite-rps", type=float, default=0.0, help="throttling del Graph simulado")
+    parser.add_argument("--plantilla", action="store_true", help="incluye xlwings en los fallos de la caché")
+    parser.add_argument("--mismo-pdf", action="store_true", help="todas las sesiones suben el mismo PDF")
+    args = parser.parse_args()
+
+    config = ConfigSimulacion(args.latencia, args.jitter, args.limite_rps)
+    servidor, graph_url = iniciar_en_segundo_plano(config)
+    os.environ["GRAPH_URL"] = graph_url  # lo heredan también los procesos trabajadores
+
+    from trabajos import GestorTrabajos
+    from almacen_pedidos import AlmacenPedidos
+    from cache_salidas import CacheSalidas
+    opciones = {"cola_max": args.sesiones * args.iteraciones}
+    if args.workers:
+        opciones["workers"] = args.workers
+    gestor = GestorTrabajos(**opciones)
+
+    with open(args.pdf, "rb") as f:
+        pdf_bytes = f.read()
+    nombre_pdf = os.path.basename(args.pdf)
+    resultados = Resultados()
+    directorio = tempfile.mkdtemp(prefix="carga_sesiones_")
+    almacen = AlmacenPedidos(os.path.join(directorio, "pedidos.db"))
+    cache = CacheSalidas(os.path.join(directorio, "cache_salidas"))
+
+    hilos = [
+        threading.Thread(
+            target=sesion,
+            args=(n, args.iteraciones, pdf_bytes, nombre_pdf, args, gestor, almacen, cache, resultados)
+        )
+        for n in range(args.sesiones)
+    ]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+
+    gestor.cerrar()
+    servidor.shutdown()
+    shutil.rmtree(directorio, ignore_errors=True)
+
+    print(f"\n{'etapa':<14}{'n':>6}{'p50 (s)':>10}{'p95 (s)':>10}{'p99 (s)':>10}{'errores':>9}")
+    for etapa in ETAPAS:
+        valores = resultados.tiempos.get(etapa, [])
+        if not valores and not resultados.errores.get(etapa):
+            continue
+        print(
+            f"{etapa:<14}{len(valores):>6}"
+            f"{percentil(valores, 50):>10.3f}{percentil(valores, 95):>10.3f}{percentil(valores, 99):>10.3f}"
+            f"{resultados.errores.get(etapa, 0):>9}"
+        )
+
+    completadas = len(resultados.tiempos.get("total", []))
+    print(f"\nSesiones: {args.sesiones} × {args.iteraciones} iteraciones en {duracion:.2f} s")
+    print(f"Rendimiento: {completadas / duracion:.2f} pedidos/s ({completadas} completados)")
+    print(f"Graph simulado: peticiones {dict(config.peticiones)}, 429 {dict(config.throttled)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# benchmarks/carga_trabajos.py
+"""
+Prueba de carga del pool de trabajos: envía N extracciones del mismo PDF y mide
+el rendimiento (PDFs/s) con distinto número de procesos trabajadores.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.carga_trabajos pedido.pdf --trabajos 32 --workers 1 2 4
+"""
+import argparse
+import time
+from trabajos import GestorTrabajos, ColaLlena, COMPLETADO
+from extraer_tabla import extraer_tabla
+
+
+def medir(pdf_bytes: bytes, workers: int, n_trabajos: int) -> float:
+    gestor = GestorTrabajos(workers=workers, cola_max=n_trabajos)
+    try:
+        # Calentamiento: que todos los procesos hayan importado las dependencias
+        for trabajo_id in [gestor.enviar(extraer_tabla, pdf_bytes) for _ in range(workers)]:
+            gestor.esperar(trabajo_id)
+
+        inicio = time.perf_counter()
+        ids = []
+        for _ in range(n_trabajos):
+            try:
+                ids.append(gestor.enviar(extraer_tabla, pdf_bytes))
+            except ColaLlena as e:
+                print(f"  ⚠️ {e}")
+        fallidos = sum(1 for i in ids if gestor.esperar(i).estado != COMPLETADO)
+        duracion = time.perf_counter() - inicio
+    finally:
+        gestor.cerrar()
+
+    if fallidos:
+        print(f"  ⚠️ {fallidos} trabajos no se completaron")
+    return len(ids) / duracion
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", help="PDF de pedido de ejemplo")
+    parser.add_argument("--trabajos", type=int, default=32, help="trabajos por medición")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    with open(args.pdf, "rb") as f:
+        pdf_bytes = f.read()
+
+    base = None
+    print(f"{'workers':>8} {'PDFs/s':>10} {'speed-up':>9}")
+    for workers in args.workers:
+        rendimiento = medir(pdf_bytes, workers, args.trabajos)
+        base = base or rendimiento
+        print(f"{workers:>8} {rendimiento:>10.2f} {rendimiento / base:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# benchmarks/extraccion_paralela.py
+"""
+Mide la extracción de un PDF grande (p. ej. un pedido consolidado de 300+ páginas)
+en serie y repartiendo las páginas entre varios procesos. Comprueba además que el
+resultado (filas y tienda) es idéntico al de la extracción en serie.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.extraccion_paralela consolidado.pdf --workers 1 2 4 8
+"""
+import argparse
+import time
+from extraer_tabla import extraer_tabla
+
+
+def medir(pdf_bytes: bytes, workers: int, repeticiones: int):
+    extraer_tabla(pdf_bytes, workers=workers)  # calentamiento: arranca el pool de procesos
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = extraer_tabla(pdf_bytes, workers=workers)
+    return (time.perf_counter() - inicio) / repeticiones, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", help="PDF de pedido (cuantas más páginas, más se nota)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.pdf, "rb") as f:
+        pdf_bytes = f.read()
+
+    base_tiempo, base_resultado = medir(pdf_bytes, 1, args.repeticiones)
+    filas, tienda = base_resultado
+    print(f"{len(filas)} líneas, tienda {tienda or '-'}\n")
+    print(f"{'workers':>8} {'tiempo (s)':>11} {'speed-up':>9}  resultado")
+    for workers in args.workers:
+        tiempo, resultado = (base_tiempo, base_resultado) if workers == 1 else medir(pdf_bytes, workers, args.repeticiones)
+        igual = "idéntico" if resultado == base_resultado else "⚠️ DISTINTO"
+        print(f"{workers:>8} {tiempo:>11.3f} {base_tiempo / tiempo:>8.2f}x  {igual}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# benchmarks/graph_peticiones.py
+"""
+Cuenta las peticiones HTTP que hace cada operación lógica contra el Graph simulado.
+Con el direccionamiento por ruta (graph.url_archivo) tanto la lectura de la Orden
+Maestra como la subida a SharePoint deben costar una sola petición; el script
+termina con error si no es así.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.graph_peticiones
+"""
+import os
+import sys
+from io import BytesIO
+from graph_simulado import ConfigSimulacion, iniciar_en_segundo_plano
+
+ESPERADAS = {"orden_maestro": 1, "subida": 1}
+
+
+def main():
+    config = ConfigSimulacion(skus=["00123", "456", "789"])
+    servidor, graph_url = iniciar_en_segundo_plano(config)
+    os.environ["GRAPH_URL"] = graph_url  # antes de importar el código que usa Graph
+
+    from extraer_tabla import obtener_orden_maestro_cached
+    from exportacion_plantilla import subir_a_sharepoint
+
+    medidas = {}
+
+    config.reiniciar_contadores()
+    orden = obtener_orden_maestro_cached("token-prueba")
+    medidas["orden_maestro"] = sum(config.peticiones.values())
+    assert orden == ["123", "456", "789"], f"Orden Maestra inesperada: {orden}"
+
+    config.reiniciar_contadores()
+    assert subir_a_sharepoint(BytesIO(b"contenido"), "123456 - SaeGA.xlsm", "token-prueba"), "subida fallida"
+    medidas["subida"] = sum(config.peticiones.values())
+    assert config.subidas.get("General/PoC Plantillas SaEGA/123456 - SaeGA.xlsm") == b"contenido"
+
+    servidor.shutdown()
+
+    fallos = 0
+    for operacion, esperadas in ESPERADAS.items():
+        ok = medidas[operacion] == esperadas
+        fallos += not ok
+        print(f"{operacion:<15} {medidas[operacion]} petición(es)  {'✅' if ok else f'❌ (esperadas {esperadas})'}")
+    sys.exit(1 if fallos else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# benchmarks/solapamiento_graph.py
+"""
+Compara `procesar_pedido` en serie (parsear y luego descargar la Orden Maestra)
+con la versión que descarga la Orden Maestra en paralelo al parseo, contra un
+Graph simulado lento. Con solapamiento la latencia debería acercarse a
+max(parseo, descarga) en lugar de a su suma.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.solapamiento_graph pedido.pdf --latencia 0.4 --repeticiones 5
+"""
+import os
+import time
+import argparse
+import statistics
+from graph_simulado import ConfigSimulacion, iniciar_en_segundo_plano
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", help="PDF de pedido de ejemplo")
+    parser.add_argument("--latencia", type=float, default=0.4, help="segundos por llamada al Graph simulado")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    servidor, graph_url = iniciar_en_segundo_plano(ConfigSimulacion(latencia=args.latencia))
+    os.environ["GRAPH_URL"] = graph_url  # antes de importar el código que usa Graph
+
+    from extraer_tabla import procesar_pedido, extraer_tabla, obtener_orden_maestro_cached
+
+    with open(args.pdf, "rb") as f:
+        pdf_bytes = f.read()
+
+    # Cada medida usa un token distinto para que la Orden Maestra no salga del caché
+    tokens = (f"bench-{i}" for i in range(10_000))
+
+    def medir(funcion) -> float:
+        tiempos = []
+        for _ in range(args.repeticiones):
+            inicio = time.perf_counter()
+            funcion(next(tokens))
+            tiempos.append(time.perf_counter() - inicio)
+        return statistics.median(tiempos)
+
+    extraer_tabla(pdf_bytes)  # calentamiento
+    parseo = medir(lambda _: extraer_tabla(pdf_bytes))
+    descarga = medir(obtener_orden_maestro_cached)
+    serie = medir(lambda token: procesar_pedido(pdf_bytes, token, solapar=False))
+    solapado = medir(lambda token: procesar_pedido(pdf_bytes, token, solapar=True))
+    servidor.shutdown()
+
+    print(f"parseo (extraer_tabla)        {parseo:8.3f} s")
+    print(f"descarga Orden Maestra        {descarga:8.3f} s")
+    print(f"suma / máximo                 {parseo + descarga:8.3f} s / {max(parseo, descarga):.3f} s")
+    print(f"procesar_pedido en serie      {serie:8.3f} s")
+    print(f"procesar_pedido solapado      {solapado:8.3f} s  ({serie / solapado:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
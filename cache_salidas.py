@@ -0,0 +1,125 @@
+# cache_salidas.py
+import os
+import json
+import hashlib
+import threading
+from io import BytesIO
+import pandas as pd
+import streamlit as st
+from metricas import CACHE_CONSULTAS, CACHE_FALLOS
+
+# ---- Configuración de la caché de plantillas generadas ----
+CACHE_SALIDAS_DIR    = os.getenv("CACHE_SALIDAS_DIR", ".cache_salidas")
+CACHE_SALIDAS_MAX_MB = int(os.getenv("CACHE_SALIDAS_MAX_MB", "200"))
+MAX_BASES = 1000  # entradas máximas del índice salida → plantilla de origen
+
+
+def hash_fichero(ruta: str) -> str:
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def hash_filas_excel(bytes_data: bytes, columnas: tuple) -> str:
+    """Hash de las filas que se vuelcan en la plantilla (mismas columnas y mismo orden)."""
+    df = pd.read_excel(BytesIO(bytes_data))[list(columnas)]
+    return hashlib.sha256(df.astype(str).to_csv(index=False).encode("utf-8")).hexdigest()
+
+
+class CacheSalidas:
+    """
+    Caché en disco de plantillas .xlsm ya generadas, direccionada por contenido:
+    clave = sha256(hash de la plantilla de origen, hash de las filas volcadas).
+
+    La plantilla se reescribe en el sitio en cada exportación, así que su hash
+    cambia tras cada uso. Para que la clave sea estable se guarda un índice
+    `hash de cada salida generada → hash de la plantilla de la que salió`: si el
+    fichero actual es una salida nuestra, la base es la plantilla original.
+
+    El tamaño total está acotado; al superarlo se eliminan las entradas usadas
+    hace más tiempo (LRU por fecha de modificación, que se actualiza en cada acierto).
+    """
+
+    def __init__(self, directorio: str = CACHE_SALIDAS_DIR, max_mb: int = CACHE_SALIDAS_MAX_MB):
+        self.directorio = directorio
+        self.max_bytes = max_mb * 1024 * 1024
+        self._ruta_bases = os.path.join(directorio, "bases.json")
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+    # ---------- Claves ----------
+    def base_plantilla(self, ruta_plantilla: str) -> str:
+        h = hash_fichero(ruta_plantilla)
+        with self._lock:
+            return self._leer_bases().get(h, h)
+
+    @staticmethod
+    def clave(base: str, hash_filas: str) -> str:
+        return hashlib.sha256(f"{base}:{hash_filas}".encode("utf-8")).hexdigest()
+
+    # ---------- Lectura / escritura ----------
+    def obtener(self, clave: str):
+        """Devuelve los bytes guardados para `clave` o None si no están en caché."""
+        ruta = self._ruta(clave)
+        CACHE_CONSULTAS.inc(cache="salidas")
+        with self._lock:
+            try:
+                with open(ruta, "rb") as f:
+                    contenido = f.read()
+            except FileNotFoundError:
+                CACHE_FALLOS.inc(cache="salidas")
+                return None
+            os.utime(ruta)  # marca de uso para el LRU
+            return contenido
+
+    def guardar(self, clave: str, contenido: bytes, base: str) -> None:
+        ruta = self._ruta(clave)
+        with self._lock:
+            temporal = f"{ruta}.tmp"
+            with open(temporal, "wb") as f:
+                f.write(contenido)
+            os.replace(temporal, ruta)
+
+            bases = self._leer_bases()
+            bases[hashlib.sha256(contenido).hexdigest()] = base
+            self._escribir_bases(dict(list(bases.items())[-MAX_BASES:]))
+            self._desalojar()
+
+    # ---------- Internos (se llaman con el lock tomado) ----------
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, f"{clave}.xlsm")
+
+    def _leer_bases(self) -> dict:
+        try:
+            with open(self._ruta_bases, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _escribir_bases(self, bases: dict) -> None:
+        temporal = f"{self._ruta_bases}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(bases, f)
+        os.replace(temporal, self._ruta_bases)
+
+    def _desalojar(self) -> None:
+        entradas = []
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith(".xlsm"):
+                info = os.stat(os.path.join(self.directorio, nombre))
+                entradas.append((info.st_mtime, info.st_size, nombre))
+
+        total = sum(tam for _, tam, _ in entradas)
+        for _, tam, nombre in sorted(entradas):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directorio, nombre))
+            total -= tam
+
+
+@st.cache_resource
+def obtener_cache_salidas() -> CacheSalidas:
+    """Caché única por servidor, compartida por todas las sesiones de Streamlit."""
+    return CacheSalidas()
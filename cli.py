@@ -0,0 +1,95 @@
+# cli.py
+"""
+Conversión de pedidos ET desde la línea de comandos, uno o muchos PDFs a la vez.
+
+Con --formato csv|jsonl|parquet todas las filas van a un único fichero --salida
+y se escriben pedido a pedido según se convierte cada PDF, sin acumular el lote
+en memoria. En csv y jsonl, si --salida ya existe se añade al final (la cabecera
+CSV solo se escribe en un fichero vacío); Parquet no admite añadir a un fichero
+cerrado, así que se reescribe. Con --formato xlsx --salida es un directorio y se
+genera un `Factura_*.xlsx` por PDF, como en la aplicación.
+
+La Orden Maestra se lee de SharePoint igual que en la aplicación, así que hace
+falta un token de Microsoft Graph (--token o la variable GRAPH_ACCESS_TOKEN).
+
+Uso:
+    python cli.py pedidos/*.pdf --formato jsonl --salida pedidos.jsonl
+    python cli.py pedidos/ --formato xlsx --salida facturas/
+"""
+import os
+import sys
+import glob
+import argparse
+from extraer_tabla import procesar_pedido
+from formatos_salida import FORMATOS, abrir_escritor, serializar, nombre_salida
+
+
+def listar_pdfs(entradas: list) -> list:
+    """Expande los directorios de `entradas` a los PDFs que contienen (ordenados por nombre)."""
+    pdfs = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            pdfs.extend(sorted(glob.glob(os.path.join(entrada, "*.pdf"))))
+        else:
+            pdfs.append(entrada)
+    return pdfs
+
+
+def convertir_lote(pdfs: list, formato: str, salida: str, access_token: str) -> tuple:
+    """Convierte `pdfs` y vuelca sus filas en `salida`. Devuelve (PDFs convertidos, PDFs con error)."""
+    convertidos, errores = 0, 0
+
+    if formato == "xlsx":
+        os.makedirs(salida, exist_ok=True)
+        escritor = destino = None
+    else:
+        destino = open(salida, "wb" if formato == "parquet" else "ab")
+        escritor = abrir_escritor(formato, destino)
+
+    try:
+        for ruta in pdfs:
+            try:
+                with open(ruta, "rb") as f:
+                    df, valor_pedido, tienda, aviso = procesar_pedido(f.read(), access_token)
+                if escritor is None:
+                    with open(os.path.join(salida, nombre_salida(os.path.basename(ruta), formato)), "wb") as f:
+                        f.write(serializar(df, formato))
+                else:
+                    escritor.escribir(df)
+                    destino.flush()  # cada pedido queda en disco aunque el lote se interrumpa
+                convertidos += 1
+                print(f"✅ {ruta}: pedido {valor_pedido}, tienda {tienda or '-'}, {len(df)} líneas")
+                if aviso:
+                    print(f"⚠️ {ruta}: {aviso}", file=sys.stderr)
+            except Exception as e:
+                errores += 1
+                print(f"❌ {ruta}: {type(e).__name__}: {e}", file=sys.stderr)
+    finally:
+        if escritor is not None:
+            escritor.cerrar()
+            destino.close()
+
+    return convertidos, errores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("entradas", nargs="+", help="PDFs de pedido o directorios que los contienen")
+    parser.add_argument("--formato", choices=FORMATOS, default="csv")
+    parser.add_argument("--salida", required=True, help="fichero de salida (directorio si --formato xlsx)")
+    parser.add_argument("--token", default=os.getenv("GRAPH_ACCESS_TOKEN"), help="token de Microsoft Graph")
+    args = parser.parse_args()
+
+    if not args.token:
+        parser.error("falta el token de Microsoft Graph (--token o GRAPH_ACCESS_TOKEN)")
+    pdfs = listar_pdfs(args.entradas)
+    if not pdfs:
+        parser.error("no se encontró ningún PDF")
+
+    convertidos, errores = convertir_lote(pdfs, args.formato, args.salida, args.token)
+    print(f"\n{convertidos} PDFs convertidos, {errores} con error → {args.salida}")
+    sys.exit(1 if errores else 0)
+
+
+if __name__ == "__main__":
+    main()
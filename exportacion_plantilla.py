@@ -1,16 +1,19 @@
 # exportacion_plantilla.py
 from io import BytesIO
-import requests
-from urllib.parse import quote
 import os
 import pandas as pd
 # COM de Excel
 import xlwings as xw
+from graph import url_archivo, peticion
+from metricas import medido, ERRORES, SUBIDA_BYTES
 
 
 # ---- Ajusta esto si quieres un path por defecto para tu .xlsm local ----
 RUTA_PLANTILLA_POR_DEFECTO = "SaeGA v2.0.2 - Plantilla - copia para Importador de Pedidos - copia.xlsm"
+RUTA_PLANTILLA = RUTA_PLANTILLA_POR_DEFECTO                 # plantilla que usa la aplicación
+COLUMNAS_PLANTILLA = ("Tienda", "Código", "Cantidad")      # columnas que se vuelcan en tblPedidos
 
+@medido("limpiar_plantilla")
 def limpiar_entradas_xlwings(
     ruta_excel: str,
     hoja: str = "Pedidos",
@@ -62,6 +65,7 @@ def limpiar_entradas_xlwings(
         wb.close()
 
 
+@medido("volcar_plantilla")
 def exportar_directo_excel_xlwings(
     ruta_excel: str,
     bytes_data: bytes,
@@ -120,6 +124,7 @@ def exportar_directo_excel_xlwings(
         wb.save()
         wb.close()
 
+@medido("subida")
 def subir_a_sharepoint(
     bytes_io: BytesIO,
     nombre_archivo: str,
@@ -144,31 +149,15 @@ def subir_a_sharepoint(
         "Content-Type": "application/octet-stream",
     }
 
-    # 1) Obtener siteId
-    site_url = f"https://graph.microsoft.com/v1.0/sites/{hostname}:/sites/{site_name}"
-    site_resp = requests.get(site_url, headers=headers)
-    try:
-        site_resp.raise_for_status()
-    except Exception:
-        print("Error obteniendo siteId:", site_resp.text)
-        return False
-
-    site_id = site_resp.json().get("id")
-    if not site_id:
-        print("No se pudo resolver el siteId. Respuesta:", site_resp.text)
-        return False
-
-    # 2) Subir archivo
-    ruta_archivo = f"{carpeta_destino}/{nombre_archivo}"
-    # Mantener las barras en la ruta (muy importante para Graph)
-    ruta_archivo_enc = quote(ruta_archivo, safe="/")
-
-    upload_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{ruta_archivo_enc}:/content"
+    # Una sola petición: el destino se direcciona por ruta (sin resolver antes el siteId)
+    upload_url = f"{url_archivo(hostname, site_name, f'{carpeta_destino}/{nombre_archivo}')}/content"
     data_bytes = bytes_io.getvalue() if hasattr(bytes_io, "getvalue") else bytes_io
-    upload_resp = requests.put(upload_url, headers=headers, data=data_bytes)
+    SUBIDA_BYTES.observar(len(data_bytes))
+    upload_resp = peticion("PUT", upload_url, "subida", headers=headers, data=data_bytes)
 
     if upload_resp.status_code in (200, 201):
         return True
 
     print("Error al subir:", upload_resp.status_code, upload_resp.text)
+    ERRORES.inc(etapa="subida")
     return False
@@ -3,11 +3,42 @@ import pdfplumber
 import pandas as pd
 import os
 import re
+import mmap
+import tempfile
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from openpyxl.worksheet.table import Table, TableStyleInfo
 import requests
-from urllib.parse import quote
 import streamlit as st
 from openpyxl.utils import get_column_letter
+from graph import url_archivo, peticion
+from metricas import (
+    medido,
+    PDFS_PROCESADOS,
+    PDF_PAGINAS,
+    LINEAS_EXTRAIDAS,
+    FILAS_SIN_ORDEN,
+    ERRORES,
+    CACHE_CONSULTAS,
+    CACHE_FALLOS
+)
+
+# ⚙️ Extracción en paralelo por páginas (para PDFs grandes)
+EXTRACCION_PARALELA_MIN_PAGINAS = int(os.getenv("EXTRACCION_PARALELA_MIN_PAGINAS", "60"))
+# Por defecto se reparten los núcleos entre los procesos del pool de trabajos (ver trabajos.py),
+# que pueden estar extrayendo PDFs grandes a la vez
+EXTRACCION_WORKERS = int(os.getenv(
+    "EXTRACCION_WORKERS",
+    str(max(1, (os.cpu_count() or 1) // max(1, int(os.getenv("TRABAJOS_WORKERS", "2")))))
+))
+_pool_paginas = None
+_pool_paginas_workers = 0
+_lock_pool_paginas = threading.Lock()
+
+# 🌐 Hilos para descargar la Orden Maestra mientras se parsea el PDF (trabajo de E/S)
+_pool_graph = ThreadPoolExecutor(max_workers=4, thread_name_prefix="orden_maestro")
 
 # 📋 Columnas de salida
 COLUMNAS = ["Tienda",                # Relleno
@@ -24,12 +55,25 @@ COLUMNAS = ["Tienda",                # Relleno
     "Precio de coste Departamento"   # Fijo "985"
 ]
 
+
+class OrdenMaestraNoDisponible(Exception):
+    """No se pudo leer la Orden Maestra; las líneas quedan sin ordenar."""
+
+
+# Valor de pedido cuando no se encuentra en la primera tabla del PDF
+PEDIDO_NO_ENCONTRADO = "PEDIDO_NO_ENCONTRADO"
+
 @st.cache_data(ttl=300)  # El caché sigue siendo útil para evitar llamadas repetidas a la API
+@medido("orden_maestro")  # Debajo del caché: solo mide las descargas reales
 def obtener_orden_maestro_cached(access_token: str) -> list:
     """
     Versión optimizada que lee solo la columna necesaria de la tabla en SharePoint
     usando la API de Microsoft Graph, sin descargar el archivo Excel completo.
+
+    Si falla lanza OrdenMaestraNoDisponible: se ejecuta en los procesos trabajadores,
+    donde st.error no llega a la UI, y así el fallo tampoco queda en caché.
     """
+    CACHE_FALLOS.inc(cache="orden_maestro")
     hostname = "saboraespana.sharepoint.com"
     site_name = "DepartamentodeProducto"
     file_path = "General/Aplicaciones/Cadena de Suministro/Herramienta de Aprovisionamiento v1.0.2.xlsx"
@@ -38,35 +82,19 @@ def obtener_orden_maestro_cached(access_token: str) -> list:
     columna_codigos = "SKU"
 
     headers = {"Authorization": f"Bearer {access_token}"}
-    
-    # URL base para las llamadas a la API de Graph
-    graph_url = "https://graph.microsoft.com/v1.0"
 
     try:
-        # 1. Obtener siteId
-        site_url = f"{graph_url}/sites/{hostname}:/sites/{site_name}"
-        site_resp = requests.get(site_url, headers=headers)
-        site_resp.raise_for_status()
-        site_id = site_resp.json()["id"]
-
-        # 2. Obtener driveItemId del archivo
-        # La ruta debe estar codificada para la URL, pero sin codificar las barras '/'
-        file_path_encoded = quote(file_path, safe='')
-        item_url = f"{graph_url}/sites/{site_id}/drive/root:/{file_path_encoded}"
-        item_resp = requests.get(item_url, headers=headers)
-        item_resp.raise_for_status()
-        item_id = item_resp.json()["id"]
-
-        # 3. Leer directamente el rango de la columna de la tabla
-        # Esta es la llamada clave que evita la descarga del archivo
+        # 1. Leer directamente el rango de la columna de la tabla
+        # Esta es la llamada clave que evita la descarga del archivo. El archivo se
+        # direcciona por ruta, así que no hace falta resolver antes siteId ni driveItemId
         column_data_url = (
-            f"{graph_url}/sites/{site_id}/drive/items/{item_id}/workbook/tables('{nombre_tabla}')"
+            f"{url_archivo(hostname, site_name, file_path)}/workbook/tables('{nombre_tabla}')"
             f"/columns('{columna_codigos}')/range"
         )
         
         # Usamos $select para pedir solo el campo 'values' y reducir la respuesta
         params = {"$select": "values"}
-        data_resp = requests.get(column_data_url, headers=headers, params=params)
+        data_resp = peticion("GET", column_data_url, "rango_tabla", headers=headers, params=params)
         data_resp.raise_for_status()
         
         # El resultado es un JSON con una matriz de valores
@@ -74,9 +102,9 @@ def obtener_orden_maestro_cached(access_token: str) -> list:
         json_data = data_resp.json()
         values = json_data.get("values", [])
 
-        # 4. Procesar la lista de códigos directamente desde el JSON
+        # 2. Procesar la lista de códigos directamente desde el JSON
         if not values or len(values) < 2:  # Si no hay datos o solo la cabecera
-            return []
+            raise OrdenMaestraNoDisponible("La Orden Maestra de SharePoint está vacía.")
 
         # Omitimos la primera fila (cabecera) y procesamos el resto
         orden_maestro = [
@@ -88,30 +116,48 @@ def obtener_orden_maestro_cached(access_token: str) -> list:
         return orden_maestro
 
     except requests.exceptions.RequestException as e:
-        # Manejo de errores de red o de la API
-        st.error(f"Error al contactar con la API de Microsoft Graph: {e}")
-        return []
+        # Manejo de errores de red o de la API (el error lo cuenta @medido al propagarse)
+        raise OrdenMaestraNoDisponible(f"Error al contactar con la API de Microsoft Graph: {e}") from e
     except (KeyError, IndexError) as e:
         # Manejo de errores por respuesta inesperada del JSON
-        st.error(f"Error al procesar la respuesta de la API (estructura inesperada): {e}")
-        return []
+        raise OrdenMaestraNoDisponible(
+            f"Error al procesar la respuesta de la API (estructura inesperada): {e}"
+        ) from e
+
+
+def obtener_orden_maestro(access_token: str) -> tuple:
+    """Devuelve (Orden Maestra, aviso): si no se pudo leer, ([], mensaje para el usuario)."""
+    try:
+        return obtener_orden_maestro_cached(access_token), None
+    except OrdenMaestraNoDisponible as e:
+        return [], f"{e} Las líneas no se han ordenado según la Orden Maestra."
     
 
 def ordenar_lineas(df, orden_maestro):
     pos = {codigo: i for i, codigo in enumerate(orden_maestro)}
     df["orden_idx"] = df["Código"].map(pos).fillna(float("inf"))
+    FILAS_SIN_ORDEN.inc(int((df["orden_idx"] == float("inf")).sum()))
     df = df.sort_values("orden_idx").drop(columns=["orden_idx"])
     return df
 
 
-def procesar_pdf(file_stream, nombre_pdf, sesion):
-    NOMBRE_BASE = os.path.splitext(nombre_pdf)[0]
+@medido("conversion")
+def procesar_pedido(pdf_content: bytes, access_token: str, solapar: bool = True) -> tuple:
+    """
+    Extrae las líneas del pedido del PDF y las ordena según la Orden Maestra.
+    Devuelve (DataFrame ordenado, número de pedido, tienda, aviso); `aviso` es None
+    salvo que no se haya podido leer la Orden Maestra (las líneas quedan sin ordenar).
+
+    Con `solapar` la Orden Maestra (llamadas a Graph) se descarga en un hilo
+    mientras se parsea el PDF, y solo se espera a ella al ordenar.
+    """
+    CACHE_CONSULTAS.inc(cache="orden_maestro")
+    if solapar:
+        futuro_orden = _pool_graph.submit(obtener_orden_maestro, access_token)
+
     filas_resultado = []
 
     # 📥 Extract values from first table - optimized single read
-    pdf_content = file_stream.read()
-    file_stream.seek(0)  # Reset for later use
-    
     with pdfplumber.open(BytesIO(pdf_content)) as pdf:
         primera_pagina = pdf.pages[0]
         tablas = primera_pagina.extract_tables()
@@ -120,7 +166,8 @@ def procesar_pdf(file_stream, nombre_pdf, sesion):
             valor_pedido = valores[1]
         except Exception as e:
             print("⚠️ Error al extraer datos de la tabla:", e)
-            valor_pedido = "PEDIDO_NO_ENCONTRADO"
+            ERRORES.inc(etapa="pedido")
+            valor_pedido = PEDIDO_NO_ENCONTRADO
             
      # ▶️ Execute with optimizations
     filas_temporales, tienda_detectada = extraer_tabla(pdf_content)
@@ -133,9 +180,23 @@ def procesar_pdf(file_stream, nombre_pdf, sesion):
         filas_resultado.append(fila)
     df = pd.DataFrame(filas_resultado, columns=COLUMNAS)
 
-    orden_maestro = obtener_orden_maestro_cached(sesion)
-    df = ordenar_lineas(df, orden_maestro)
+    if solapar:
+        orden_maestro, aviso = futuro_orden.result()
+    else:
+        orden_maestro, aviso = obtener_orden_maestro(access_token)
+    PDFS_PROCESADOS.inc()
+    return ordenar_lineas(df, orden_maestro), valor_pedido, tienda_detectada, aviso
+
+
+def obtener_filas_ordenadas(pdf_content: bytes, access_token: str) -> pd.DataFrame:
+    """Extrae las líneas del pedido del PDF y las devuelve ordenadas según la Orden Maestra."""
+    df, _, _, _ = procesar_pedido(pdf_content, access_token)
+    return df
+
 
+@medido("excel")
+def generar_excel(df: pd.DataFrame) -> BytesIO:
+    """Escribe el DataFrame en un .xlsx con formato de tabla y lo devuelve en memoria."""
     output = BytesIO()
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
         df.to_excel(writer, index=False, sheet_name="Datos")
@@ -158,46 +219,150 @@ def procesar_pdf(file_stream, nombre_pdf, sesion):
         tabla.tableStyleInfo = estilo
         worksheet.add_table(tabla)
 
-        output.seek(0)
-        nombre_final = f"Factura_{NOMBRE_BASE}.xlsx".replace(" ", "_")
-        return output, nombre_final
+    output.seek(0)
+    return output
+
+
+def nombre_excel(nombre_pdf: str) -> str:
+    NOMBRE_BASE = os.path.splitext(nombre_pdf)[0]
+    return f"Factura_{NOMBRE_BASE}.xlsx".replace(" ", "_")
+
+
+def procesar_pdf(file_stream, nombre_pdf, sesion):
+    pdf_content = file_stream.read()
+    file_stream.seek(0)  # Reset for later use
+
+    df = obtener_filas_ordenadas(pdf_content, sesion)
+    output = generar_excel(df)
+
+    return output, nombre_excel(nombre_pdf)
     
-def extraer_tabla(pdf_bytes):
+def _texto_paginas(paginas) -> str:
+    all_text = ""
+    for pagina in paginas:
+        texto_pagina = pagina.extract_text()
+        if texto_pagina:
+            all_text += texto_pagina + "\n"
+    return all_text
+
+
+def _parsear_texto(all_text: str):
     filas_temporales = []
     tienda_detectada = ""
 
-    with pdfplumber.open(BytesIO(pdf_bytes)) as pdf:
-        all_text = ""
-        for pagina in pdf.pages:
-            texto_pagina = pagina.extract_text()
-            if texto_pagina:
-                all_text += texto_pagina + "\n"
-            
-        lineas = all_text.split("\n")
-        
-        for linea in lineas:
-            linea = linea.strip()
+    lineas = all_text.split("\n")
+    
+    for linea in lineas:
+        linea = linea.strip()
+
+        # 1️⃣ Buscar tienda
+        match_tienda = re.search(r"TIENDA\s+(\d+)", linea.upper())
+        if match_tienda:
+            tienda_detectada = match_tienda.group(1)
+
+        # 2️⃣ Buscar líneas que empiezan con código
+        match_codigo = re.match(r"^(\d+)\s+(.*)", linea)
+        if match_codigo:
+            codigo = match_codigo.group(1)
+
+            # 3️⃣ Buscar unidades tipo "6,000" en la línea
+            partes = linea.split()
+            uds = ''
+            uds = next((p for p in partes if re.match(r"^\d+,\d{3}$", p)), None)
+            if uds is not None:
+                uds = uds.split(",")[0]
+
+            if codigo and uds:
+                filas_temporales.append((codigo, uds))
 
-            # 1️⃣ Buscar tienda
-            match_tienda = re.search(r"TIENDA\s+(\d+)", linea.upper())
-            if match_tienda:
-                tienda_detectada = match_tienda.group(1)
+    return filas_temporales, tienda_detectada
 
-            # 2️⃣ Buscar líneas que empiezan con código
-            match_codigo = re.match(r"^(\d+)\s+(.*)", linea)
-            if match_codigo:
-                codigo = match_codigo.group(1)
 
-                # 3️⃣ Buscar unidades tipo "6,000" en la línea
-                partes = linea.split()
-                uds = ''
-                uds = next((p for p in partes if re.match(r"^\d+,\d{3}$", p)), None)
-                if uds is not None:
-                    uds = uds.split(",")[0]
+def _extraer_rango_paginas(ruta_pdf: str, inicio: int, fin: int):
+    """Proceso de extracción: abre el PDF compartido mapeado en memoria y parsea las páginas [inicio, fin)."""
+    with open(ruta_pdf, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as datos:
+        with pdfplumber.open(datos) as pdf:
+            return _parsear_texto(_texto_paginas(pdf.pages[inicio:fin]))
 
-                if codigo and uds:
-                    filas_temporales.append((codigo, uds))
 
+def _obtener_pool_paginas(workers: int) -> ProcessPoolExecutor:
+    """Pool reutilizable entre llamadas; se recrea si cambia el número de procesos o si se rompió."""
+    global _pool_paginas, _pool_paginas_workers
+    with _lock_pool_paginas:
+        if _pool_paginas is None or _pool_paginas_workers != workers:
+            if _pool_paginas is not None:
+                _pool_paginas.shutdown(wait=False)
+            _pool_paginas = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+            _pool_paginas_workers = workers
+        return _pool_paginas
+
+
+def _descartar_pool_paginas(pool: ProcessPoolExecutor) -> None:
+    """Olvida un pool roto (p. ej. un proceso murió por falta de memoria) para que se cree otro."""
+    global _pool_paginas
+    with _lock_pool_paginas:
+        if _pool_paginas is pool:
+            _pool_paginas = None
+    pool.shutdown(wait=False)
+
+
+def _extraer_paralelo(pdf_bytes: bytes, n_paginas: int, workers: int):
+    # Varios tramos por proceso para repartir bien páginas de coste desigual
+    n_tramos = min(n_paginas, workers * 4)
+    limites = [round(i * n_paginas / n_tramos) for i in range(n_tramos + 1)]
+
+    # Los procesos leen el PDF de un fichero temporal mapeado en memoria (sin copiar los bytes a cada uno)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(pdf_bytes)
+        ruta_pdf = tmp.name
+    try:
+        for _ in range(2):
+            pool = _obtener_pool_paginas(workers)
+            try:
+                resultados = list(pool.map(
+                    _extraer_rango_paginas,
+                    [ruta_pdf] * n_tramos, limites[:-1], limites[1:]
+                ))
+                break
+            except BrokenProcessPool:
+                ERRORES.inc(etapa="extraccion")
+                _descartar_pool_paginas(pool)
+        else:
+            # El pool se ha roto dos veces seguidas: mejor lento que fallar
+            resultados = [_extraer_rango_paginas(ruta_pdf, 0, n_paginas)]
+
+        # Fusión en orden de página: la tienda es la última detectada, igual que en el bucle en serie
+        filas_temporales = []
+        tienda_detectada = ""
+        for filas, tienda in resultados:
+            filas_temporales.extend(filas)
+            if tienda:
+                tienda_detectada = tienda
         return filas_temporales, tienda_detectada
+    finally:
+        os.remove(ruta_pdf)
+
+
+@medido("extraccion")
+def extraer_tabla(pdf_bytes, workers: int = None):
+    """
+    Extrae (código, unidades) de todas las páginas y la última TIENDA detectada.
+    Con `workers` > 1 (o, por defecto, en PDFs de al menos EXTRACCION_PARALELA_MIN_PAGINAS
+    páginas) reparte las páginas entre varios procesos y fusiona los resultados en orden.
+    """
+    with pdfplumber.open(BytesIO(pdf_bytes)) as pdf:
+        n_paginas = len(pdf.pages)
+        PDF_PAGINAS.inc(n_paginas)
+
+        if workers is None:
+            workers = EXTRACCION_WORKERS if n_paginas >= EXTRACCION_PARALELA_MIN_PAGINAS else 1
+        workers = min(workers, n_paginas)
+
+        if workers <= 1:
+            filas_temporales, tienda_detectada = _parsear_texto(_texto_paginas(pdf.pages))
 
+    if workers > 1:
+        filas_temporales, tienda_detectada = _extraer_paralelo(pdf_bytes, n_paginas, workers)
 
+    LINEAS_EXTRAIDAS.inc(len(filas_temporales))
+    return filas_temporales, tienda_detectada
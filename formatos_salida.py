@@ -0,0 +1,145 @@
+# formatos_salida.py
+"""
+Escritores de las filas convertidas en formatos legibles por máquina, para los
+procesos que ingieren los pedidos sin abrir el .xlsx con openpyxl:
+    csv      → CSV UTF-8 con cabecera (solo al empezar un fichero vacío).
+    jsonl    → JSON Lines, un objeto por línea.
+    parquet  → Apache Parquet (solo si pyarrow está instalado).
+
+Todos emiten el mismo esquema: las columnas de `COLUMNAS`, en ese orden y como texto.
+Son escritores en flujo: `escribir()` se puede llamar una vez por pedido y lo
+escrito no se vuelve a guardar en memoria, de modo que un lote de muchos PDFs
+se vuelca pedido a pedido.
+"""
+import os
+import csv
+import json
+from io import BytesIO, TextIOWrapper
+import pandas as pd
+from extraer_tabla import COLUMNAS, generar_excel, nombre_excel
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: sin él no se ofrece Parquet
+    pa = pq = None
+
+MIME = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _normalizar(filas):
+    """Acepta un DataFrame o una lista de dicts y devuelve dicts con exactamente `COLUMNAS`."""
+    if isinstance(filas, pd.DataFrame):
+        filas = filas.to_dict(orient="records")
+    for fila in filas:
+        yield {c: "" if fila.get(c) is None else str(fila.get(c)) for c in COLUMNAS}
+
+
+class _Escritor:
+    """Base común: se usa como gestor de contexto y nunca cierra el fichero de destino."""
+
+    def __init__(self, destino):
+        self.destino = destino
+        self.filas = 0
+
+    def cerrar(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+class EscritorCSV(_Escritor):
+    """Si el destino ya tiene datos (un lote que se añade a un CSV existente) no repite la cabecera."""
+
+    def __init__(self, destino):
+        super().__init__(destino)
+        self._texto = TextIOWrapper(destino, encoding="utf-8", newline="", write_through=True)
+        self._csv = csv.DictWriter(self._texto, fieldnames=COLUMNAS)
+        if destino.tell() == 0:
+            self._csv.writeheader()
+
+    def escribir(self, filas) -> int:
+        n = 0
+        for fila in _normalizar(filas):
+            self._csv.writerow(fila)
+            n += 1
+        self.filas += n
+        return n
+
+    def cerrar(self):
+        self._texto.flush()
+        self._texto.detach()  # el destino sigue abierto para quien lo pasó
+
+
+class EscritorJSONL(_Escritor):
+    """JSON Lines no lleva cabecera: cada línea incluye las claves."""
+
+    def escribir(self, filas) -> int:
+        n = 0
+        for fila in _normalizar(filas):
+            self.destino.write(json.dumps(fila, ensure_ascii=False).encode("utf-8") + b"\n")
+            n += 1
+        self.filas += n
+        return n
+
+
+class EscritorParquet(_Escritor):
+    """Cada llamada a `escribir()` añade un row group; el pie del fichero se escribe al cerrar."""
+
+    def __init__(self, destino):
+        if pq is None:
+            raise RuntimeError("El formato parquet necesita pyarrow instalado")
+        super().__init__(destino)
+        self._esquema = pa.schema([(c, pa.string()) for c in COLUMNAS])
+        self._parquet = pq.ParquetWriter(destino, self._esquema)
+
+    def escribir(self, filas) -> int:
+        filas = list(_normalizar(filas))
+        if filas:
+            self._parquet.write_table(pa.Table.from_pylist(filas, schema=self._esquema))
+        self.filas += len(filas)
+        return len(filas)
+
+    def cerrar(self):
+        self._parquet.close()
+
+
+ESCRITORES = {"csv": EscritorCSV, "jsonl": EscritorJSONL}
+if pq is not None:
+    ESCRITORES["parquet"] = EscritorParquet
+
+# Formatos que se ofrecen en la UI, la CLI y el servicio HTTP
+FORMATOS = ("xlsx", *ESCRITORES)
+
+
+def abrir_escritor(formato: str, destino) -> _Escritor:
+    """Escritor en flujo para `formato` sobre un fichero binario ya abierto."""
+    if formato not in ESCRITORES:
+        raise ValueError(f"Formato no soportado para escritura en flujo: {formato}")
+    return ESCRITORES[formato](destino)
+
+
+def serializar(filas, formato: str) -> bytes:
+    """Las filas de un pedido en `formato`, en memoria (para descargas y respuestas HTTP)."""
+    if formato == "xlsx":
+        if not isinstance(filas, pd.DataFrame):
+            filas = pd.DataFrame(list(filas), columns=COLUMNAS)
+        return generar_excel(filas).getvalue()
+    salida = BytesIO()
+    with abrir_escritor(formato, salida) as escritor:
+        escritor.escribir(filas)
+    return salida.getvalue()
+
+
+def nombre_salida(nombre_pdf: str, formato: str) -> str:
+    """Mismo nombre que el Excel (`Factura_*`) con la extensión del formato."""
+    return f"{os.path.splitext(nombre_excel(nombre_pdf))[0]}.{formato}"
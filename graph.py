@@ -0,0 +1,41 @@
+# graph.py
+import os
+import time
+import requests
+from urllib.parse import quote
+from metricas import GRAPH_PETICIONES, GRAPH_LATENCIA
+
+# URL base de Microsoft Graph. Se puede apuntar a un servidor local
+# (ver graph_simulado.py) para pruebas de carga sin tocar el tenant real.
+GRAPH_URL = os.getenv("GRAPH_URL", "https://graph.microsoft.com/v1.0")
+
+
+def url_archivo(hostname: str, site_name: str, ruta_archivo: str) -> str:
+    """
+    URL de un archivo del Drive de un sitio direccionada por rutas, sin resolver ids:
+    /sites/{hostname}:/sites/{site}:/drive/root:/{ruta}:
+    Se le pueden añadir segmentos como '/content' o '/workbook/...', de modo que cada
+    operación cuesta una sola petición en vez de site → item → operación.
+    """
+    # Mantener las barras en la ruta (muy importante para Graph)
+    return (
+        f"{GRAPH_URL}/sites/{hostname}:/sites/{quote(site_name, safe='')}:"
+        f"/drive/root:/{quote(ruta_archivo, safe='/')}:"
+    )
+
+
+def peticion(metodo: str, url: str, endpoint: str, **kwargs) -> requests.Response:
+    """
+    Llama a Graph con `requests` y registra latencia y código de estado por endpoint.
+    `endpoint` es un nombre corto y estable (p. ej. 'sitio'), no la URL con ids.
+    """
+    inicio = time.perf_counter()
+    try:
+        resp = requests.request(metodo, url, **kwargs)
+    except requests.exceptions.RequestException:
+        GRAPH_PETICIONES.inc(endpoint=endpoint, estado="error_red")
+        raise
+    finally:
+        GRAPH_LATENCIA.observar(time.perf_counter() - inicio, endpoint=endpoint)
+    GRAPH_PETICIONES.inc(endpoint=endpoint, estado=resp.status_code)
+    return resp
@@ -0,0 +1,188 @@
+# graph_simulado.py
+"""
+Servidor local que imita los endpoints de Microsoft Graph que usa la aplicación:
+    GET /v1.0/sites/{hostname}:/sites/{site}                          → siteId
+    GET /v1.0/sites/{siteId}/drive/root:/{ruta}                       → driveItemId
+    GET /v1.0/sites/{siteId}/drive/items/{itemId}/workbook/tables('T')/columns('C')/range
+    PUT /v1.0/sites/{siteId}/drive/root:/{ruta}:/content              → subida de fichero
+y las mismas operaciones direccionadas por ruta (una sola petición, ver graph.url_archivo):
+    GET /v1.0/sites/{hostname}:/sites/{site}:/drive/root:/{ruta}:/workbook/tables('T')/columns('C')/range
+    PUT /v1.0/sites/{hostname}:/sites/{site}:/drive/root:/{ruta}:/content
+
+Permite simular latencia y throttling (429 con Retry-After) para pruebas de carga.
+Se usa apuntando la aplicación a él con la variable de entorno GRAPH_URL, p. ej.:
+    GRAPH_URL=http://127.0.0.1:8765/v1.0
+
+Uso independiente:
+    python graph_simulado.py --puerto 8765 --latencia 0.15 --limite-rps 20
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, unquote
+
+RUTAS = [
+    # Direccionamiento por ruta: /sites/{hostname}:/sites/{site}:/drive/root:/{ruta}:/...
+    ("PUT", "subida",       re.compile(r"^/v1\.0/sites/([^/:]+:/sites/[^/:]+):/drive/root:/(.+):/content$")),
+    ("GET", "rango_tabla",  re.compile(r"^/v1\.0/sites/([^/:]+:/sites/[^/:]+):/drive/root:/(.+):/workbook"
+                                       r"/tables\('([^']+)'\)/columns\('([^']+)'\)/range$")),
+    # Direccionamiento por ids
+    ("PUT", "subida",       re.compile(r"^/v1\.0/sites/([^/]+)/drive/root:/(.+):/content$")),
+    ("GET", "rango_tabla",  re.compile(r"^/v1\.0/sites/([^/]+)/drive/items/([^/]+)/workbook"
+                                       r"/tables\('([^']+)'\)/columns\('([^']+)'\)/range$")),
+    ("GET", "drive_item",   re.compile(r"^/v1\.0/sites/([^/]+)/drive/root:/(.+)$")),
+    ("GET", "sitio",        re.compile(r"^/v1\.0/sites/([^/:]+):/sites/([^/]+)$")),
+]
+
+
+class ConfigSimulacion:
+    def __init__(self, latencia: float = 0.0, jitter: float = 0.0, limite_rps: float = 0.0, skus: list = None):
+        self.latencia = latencia        # segundos añadidos a cada respuesta
+        self.jitter = jitter            # variación aleatoria (± segundos) sobre la latencia
+        self.limite_rps = limite_rps    # 0 = sin throttling; si no, peticiones/s antes de responder 429
+        self.skus = skus if skus is not None else [str(10000 + i) for i in range(500)]
+
+        self.peticiones = Counter()     # peticiones atendidas por endpoint
+        self.throttled = Counter()      # respuestas 429 por endpoint
+        self.subidas = {}               # ruta → bytes subidos
+        self._lock = threading.Lock()
+        self._ventana = []              # instantes de las peticiones del último segundo
+
+    def admitir(self) -> bool:
+        """Ventana deslizante de 1 s: devuelve False si se supera el límite de peticiones."""
+        if not self.limite_rps:
+            return True
+        ahora = time.monotonic()
+        with self._lock:
+            self._ventana = [t for t in self._ventana if ahora - t < 1.0]
+            if len(self._ventana) >= self.limite_rps:
+                return False
+            self._ventana.append(ahora)
+            return True
+
+    def esperar(self):
+        retardo = self.latencia + random.uniform(-self.jitter, self.jitter)
+        if retardo > 0:
+            time.sleep(retardo)
+
+    def reiniciar_contadores(self):
+        with self._lock:
+            self.peticiones.clear()
+            self.throttled.clear()
+
+
+def _id_estable(*partes) -> str:
+    return hashlib.sha1("|".join(partes).encode("utf-8")).hexdigest()[:16].upper()
+
+
+class ManejadorGraph(BaseHTTPRequestHandler):
+    config = ConfigSimulacion()
+    protocol_version = "HTTP/1.1"
+
+    def _responder_json(self, codigo: int, datos: dict, cabeceras: dict = None):
+        cuerpo = json.dumps(datos).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for clave, valor in (cabeceras or {}).items():
+            self.send_header(clave, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _resolver(self, metodo: str):
+        ruta = unquote(urlparse(self.path).path)
+        for metodo_ruta, nombre, patron in RUTAS:
+            if metodo_ruta == metodo:
+                match = patron.match(ruta)
+                if match:
+                    return nombre, match.groups()
+        return None, None
+
+    def _atender(self, metodo: str):
+        cuerpo = b""
+        if metodo == "PUT":
+            cuerpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        nombre, grupos = self._resolver(metodo)
+        if nombre is None:
+            self._responder_json(404, {"error": {"code": "itemNotFound", "message": self.path}})
+            return
+
+        cfg = self.config
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self._responder_json(401, {"error": {"code": "InvalidAuthenticationToken"}})
+            return
+        if not cfg.admitir():
+            with cfg._lock:
+                cfg.throttled[nombre] += 1
+            self._responder_json(429, {"error": {"code": "TooManyRequests"}}, {"Retry-After": "1"})
+            return
+
+        cfg.esperar()
+        with cfg._lock:
+            cfg.peticiones[nombre] += 1
+
+        if nombre == "sitio":
+            hostname, sitio = grupos
+            self._responder_json(200, {"id": f"{hostname},{_id_estable(sitio)}", "name": sitio})
+        elif nombre == "drive_item":
+            site_id, ruta = grupos
+            self._responder_json(200, {"id": _id_estable(site_id, ruta), "name": ruta.rsplit("/", 1)[-1]})
+        elif nombre == "rango_tabla":
+            _, _, _, columna = grupos
+            self._responder_json(200, {"values": [[columna]] + [[sku] for sku in cfg.skus]})
+        elif nombre == "subida":
+            site_id, ruta = grupos
+            with cfg._lock:
+                cfg.subidas[ruta] = cuerpo
+            self._responder_json(201, {"id": _id_estable(site_id, ruta), "size": len(cuerpo)})
+
+    def do_GET(self):
+        self._atender("GET")
+
+    def do_PUT(self):
+        self._atender("PUT")
+
+    def log_message(self, formato, *args):
+        pass  # silencioso: en pruebas de carga el log sería ruido
+
+
+def iniciar_en_segundo_plano(config: ConfigSimulacion, host: str = "127.0.0.1", puerto: int = 0):
+    """Arranca el servidor en un hilo y devuelve (servidor, GRAPH_URL a usar)."""
+    manejador = type("ManejadorGraphConfigurado", (ManejadorGraph,), {"config": config})
+    servidor = ThreadingHTTPServer((host, puerto), manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    host_real, puerto_real = servidor.server_address[:2]
+    return servidor, f"http://{host_real}:{puerto_real}/v1.0"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que simula Microsoft Graph")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos por respuesta")
+    parser.add_argument("--jitter", type=float, default=0.0, help="± segundos aleatorios")
+    parser.add_argument("--limite-rps", type=float, default=0.0, help="peticiones/s antes de 429 (0 = sin límite)")
+    args = parser.parse_args()
+
+    config = ConfigSimulacion(args.latencia, args.jitter, args.limite_rps)
+    manejador = type("ManejadorGraphConfigurado", (ManejadorGraph,), {"config": config})
+    servidor = ThreadingHTTPServer((args.host, args.puerto), manejador)
+    print(f"Graph simulado en http://{args.host}:{args.puerto}/v1.0")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+# metricas.py
+"""
+Registro de métricas (contadores e histogramas) con exportación en formato texto de Prometheus.
+
+- Se exponen por HTTP en /metrics con METRICAS_PUERTO, o se vuelcan periódicamente
+  a un fichero con METRICAS_FICHERO (cada METRICAS_INTERVALO segundos).
+- Los procesos trabajadores (trabajos.py) devuelven con cada resultado las métricas
+  acumuladas durante el trabajo y el proceso principal las fusiona en su registro.
+"""
+import os
+import time
+import bisect
+import functools
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+METRICAS_PUERTO    = os.getenv("METRICAS_PUERTO")
+METRICAS_FICHERO   = os.getenv("METRICAS_FICHERO")
+METRICAS_INTERVALO = float(os.getenv("METRICAS_INTERVALO", "60"))
+
+BUCKETS_SEGUNDOS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS_BYTES    = (10_000, 50_000, 100_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 10_000_000)
+
+
+def _clave(etiquetas: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatear_etiquetas(clave: tuple, extra: tuple = ()) -> str:
+    pares = list(clave) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor: float = 1, **etiquetas):
+        clave = _clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def volcar(self, reiniciar: bool = False) -> dict:
+        with self._lock:
+            valores = dict(self._valores)
+            if reiniciar:
+                self._valores.clear()
+        return valores
+
+    def fusionar(self, valores: dict):
+        with self._lock:
+            for clave, valor in valores.items():
+                self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def exportar(self) -> list:
+        return [f"{self.nombre}{_formatear_etiquetas(clave)} {valor}"
+                for clave, valor in sorted(self.volcar().items())]
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, buckets: tuple = BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.buckets = tuple(sorted(buckets))
+        self._valores = {}  # clave → [cuentas por bucket (+Inf al final), suma, total]
+        self._lock = threading.Lock()
+
+    def _nuevo(self) -> list:
+        return [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+    def observar(self, valor: float, **etiquetas):
+        clave = _clave(etiquetas)
+        with self._lock:
+            datos = self._valores.setdefault(clave, self._nuevo())
+            datos[0][bisect.bisect_left(self.buckets, valor)] += 1
+            datos[1] += valor
+            datos[2] += 1
+
+    def volcar(self, reiniciar: bool = False) -> dict:
+        with self._lock:
+            valores = {k: [list(v[0]), v[1], v[2]] for k, v in self._valores.items()}
+            if reiniciar:
+                self._valores.clear()
+        return valores
+
+    def fusionar(self, valores: dict):
+        with self._lock:
+            for clave, (cuentas, suma, total) in valores.items():
+                datos = self._valores.setdefault(clave, self._nuevo())
+                datos[0] = [a + b for a, b in zip(datos[0], cuentas)]
+                datos[1] += suma
+                datos[2] += total
+
+    def exportar(self) -> list:
+        lineas = []
+        for clave, (cuentas, suma, total) in sorted(self.volcar().items()):
+            acumulado = 0
+            for limite, cuenta in zip(list(self.buckets) + ["+Inf"], cuentas):
+                acumulado += cuenta
+                lineas.append(f"{self.nombre}_bucket{_formatear_etiquetas(clave, (('le', limite),))} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_formatear_etiquetas(clave)} {suma}")
+            lineas.append(f"{self.nombre}_count{_formatear_etiquetas(clave)} {total}")
+        return lineas
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = {}
+
+    def contador(self, nombre: str, ayuda: str) -> Contador:
+        return self._metricas.setdefault(nombre, Contador(nombre, ayuda))
+
+    def histograma(self, nombre: str, ayuda: str, buckets: tuple = BUCKETS_SEGUNDOS) -> Histograma:
+        return self._metricas.setdefault(nombre, Histograma(nombre, ayuda, buckets))
+
+    def volcar(self, reiniciar: bool = False) -> dict:
+        """Instantánea serializable (pickle) de todas las métricas."""
+        return {nombre: m.volcar(reiniciar) for nombre, m in self._metricas.items()}
+
+    def fusionar(self, instantanea: dict):
+        for nombre, valores in (instantanea or {}).items():
+            if nombre in self._metricas:
+                self._metricas[nombre].fusionar(valores)
+
+    def exportar(self) -> str:
+        lineas = []
+        for m in self._metricas.values():
+            lineas.append(f"# HELP {m.nombre} {m.ayuda}")
+            lineas.append(f"# TYPE {m.nombre} {m.tipo}")
+            lineas.extend(m.exportar())
+        return "\n".join(lineas) + "\n"
+
+
+REGISTRO = Registro()
+
+# ---------- Métricas de la aplicación ----------
+PDFS_PROCESADOS   = REGISTRO.contador("pedidos_pdfs_procesados_total", "PDFs convertidos (los fallidos cuentan en errores_total)")
+PDF_PAGINAS       = REGISTRO.contador("pedidos_pdf_paginas_total", "Páginas de PDF leídas")
+LINEAS_EXTRAIDAS  = REGISTRO.contador("pedidos_lineas_extraidas_total", "Líneas de pedido extraídas")
+FILAS_SIN_ORDEN   = REGISTRO.contador("pedidos_filas_sin_orden_maestro_total",
+                                      "Líneas cuyo código no está en la Orden Maestra")
+ERRORES           = REGISTRO.contador("pedidos_errores_total", "Errores por etapa")
+ETAPA_DURACION    = REGISTRO.histograma("pedidos_etapa_duracion_segundos", "Duración de cada etapa")
+GRAPH_PETICIONES  = REGISTRO.contador("pedidos_graph_peticiones_total",
+                                      "Peticiones a Microsoft Graph por endpoint y código de estado")
+GRAPH_LATENCIA    = REGISTRO.histograma("pedidos_graph_latencia_segundos",
+                                        "Latencia de las peticiones a Microsoft Graph por endpoint")
+SUBIDA_BYTES      = REGISTRO.histograma("pedidos_subida_bytes", "Tamaño de los ficheros subidos a SharePoint",
+                                        BUCKETS_BYTES)
+CACHE_CONSULTAS   = REGISTRO.contador("pedidos_cache_consultas_total", "Consultas a cada caché")
+CACHE_FALLOS      = REGISTRO.contador("pedidos_cache_fallos_total", "Fallos de cada caché")
+LOGINS            = REGISTRO.contador("pedidos_logins_total", "Intentos de login por resultado")
+
+
+def medido(etapa: str):
+    """Decorador: registra la duración de la función y cuenta sus excepciones como error de `etapa`."""
+    def decorador(func):
+        @functools.wraps(func)
+        def envoltura(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                ERRORES.inc(etapa=etapa)
+                raise
+            finally:
+                ETAPA_DURACION.observar(time.perf_counter() - inicio, etapa=etapa)
+        return envoltura
+    return decorador
+
+
+# ---------- Exportación ----------
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = REGISTRO.exportar().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        pass
+
+
+_exportacion_iniciada = False
+_lock_exportacion = threading.Lock()
+
+
+def iniciar_exportacion():
+    """Arranca (una sola vez por proceso) el endpoint /metrics y/o el volcado periódico a fichero."""
+    global _exportacion_iniciada
+    with _lock_exportacion:
+        if _exportacion_iniciada:
+            return
+        _exportacion_iniciada = True
+
+    if METRICAS_PUERTO:
+        servidor = ThreadingHTTPServer(("0.0.0.0", int(METRICAS_PUERTO)), _ManejadorMetricas)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    if METRICAS_FICHERO:
+        def volcado_loop():
+            while True:
+                time.sleep(METRICAS_INTERVALO)
+                try:
+                    temporal = f"{METRICAS_FICHERO}.tmp"
+                    with open(temporal, "w", encoding="utf-8") as f:
+                        f.write(REGISTRO.exportar())
+                    os.replace(temporal, METRICAS_FICHERO)
+                except Exception as e:
+                    print("Error volcando métricas:", e)
+        threading.Thread(target=volcado_loop, daemon=True).start()
@@ -0,0 +1,258 @@
+# servicio_http.py
+"""
+Servicio HTTP ligero para convertir pedidos ET sin pasar por la interfaz de Streamlit.
+
+Endpoints:
+    GET  /salud                         → estado del servicio y de la cola de trabajos.
+    GET  /metrics                       → métricas en formato Prometheus (ver metricas.py).
+    POST /convertir?formato=json|xlsx|csv|jsonl|parquet   → cuerpo = PDF del pedido.
+         Cabecera `Authorization: Bearer <token>` con un token válido de Microsoft Graph
+         (se usa para leer la Orden Maestra, igual que en la aplicación).
+         Opcional: `?nombre=pedido.pdf` para el nombre del fichero devuelto (letras, dígitos,
+         espacios y `_.()-`; otro carácter → 400).
+         Si no se puede leer la Orden Maestra (Graph caído o token no válido) se responde
+         502 en lugar de devolver las líneas sin ordenar.
+         csv, jsonl y parquet devuelven las filas con el esquema COLUMNAS (ver formatos_salida.py);
+         parquet solo está disponible si pyarrow está instalado.
+
+Las conversiones se encolan en un GestorTrabajos (ver trabajos.py); si la cola está
+llena se responde 503 con `Retry-After`. Hay dos formas de arrancarlo:
+    - Dentro de la aplicación Streamlit, con la variable SERVICIO_PUERTO: comparte el
+      pool y la cola de la UI (`obtener_gestor()`), así que el tráfico del ERP y el de
+      la UI compiten por los mismos TRABAJOS_WORKERS y la contrapresión es común.
+    - Como proceso independiente: crea su propio pool, que se suma al de la UI; hay
+      que repartir TRABAJOS_WORKERS entre ambos según los núcleos de la máquina.
+
+Uso independiente:
+    python servicio_http.py --puerto 8080
+"""
+import os
+import re
+import json
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, quote
+from extraer_tabla import COLUMNAS
+from metricas import REGISTRO
+from formatos_salida import FORMATOS, MIME, serializar, nombre_salida
+from trabajos import (
+    GestorTrabajos,
+    ColaLlena,
+    convertir_pdf,
+    convertir_pdf_filas,
+    COMPLETADO,
+    TIEMPO_AGOTADO
+)
+
+SERVICIO_MAX_MB           = int(os.getenv("SERVICIO_MAX_MB", "20"))            # tamaño máximo del PDF
+SERVICIO_MAX_CONCURRENTES = int(os.getenv("SERVICIO_MAX_CONCURRENTES", "16"))  # peticiones a la vez
+SERVICIO_PUERTO           = os.getenv("SERVICIO_PUERTO")  # si se define, la app Streamlit sirve también la API
+TAM_BLOQUE = 64 * 1024
+
+# Nombres de fichero admitidos en ?nombre=: sin separadores de ruta, comillas ni saltos de línea
+NOMBRE_VALIDO = re.compile(r"^[\w .()\-]{1,200}$")
+
+
+class CuerpoDemasiadoGrande(Exception):
+    pass
+
+
+def _adjunto(nombre: str) -> str:
+    """Content-Disposition con el nombre en ASCII y, para acentos, también en UTF-8 (RFC 6266)."""
+    nombre_ascii = nombre.encode("ascii", "replace").decode("ascii").replace("?", "_")
+    return f"attachment; filename=\"{nombre_ascii}\"; filename*=UTF-8''{quote(nombre)}"
+
+
+_servicio_iniciado = False
+_lock_servicio = threading.Lock()
+
+
+class ManejadorConversion(BaseHTTPRequestHandler):
+    # Se inicializan en crear_servidor()
+    gestor = None
+    limite = None
+
+    protocol_version = "HTTP/1.1"
+
+    # ---------- Utilidades de respuesta ----------
+    def _responder(self, codigo: int, cuerpo: bytes, tipo: str, cabeceras: dict = None):
+        if codigo >= 400:
+            # El cuerpo de la petición puede no haberse leído entero: si la conexión siguiera
+            # abierta, lo que quede del PDF se interpretaría como la siguiente petición
+            self.close_connection = True
+        self.send_response(codigo)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for clave, valor in (cabeceras or {}).items():
+            self.send_header(clave, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _responder_json(self, codigo: int, datos, cabeceras: dict = None):
+        cuerpo = json.dumps(datos, ensure_ascii=False, default=str).encode("utf-8")
+        self._responder(codigo, cuerpo, "application/json; charset=utf-8", cabeceras)
+
+    def _leer_cuerpo(self) -> bytes:
+        """Lee el cuerpo por bloques (Content-Length o chunked) sin superar SERVICIO_MAX_MB."""
+        maximo = SERVICIO_MAX_MB * 1024 * 1024
+        partes, total = [], 0
+
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                tam = int(self.rfile.readline().split(b";")[0].strip(), 16)  # ValueError si está mal formado
+                if tam == 0:
+                    self.rfile.readline()  # CRLF final
+                    break
+                total += tam
+                if total > maximo:
+                    raise CuerpoDemasiadoGrande()
+                partes.append(self.rfile.read(tam))
+                self.rfile.readline()  # CRLF tras cada bloque
+            return b"".join(partes)
+
+        restante = int(self.headers.get("Content-Length", 0))  # ValueError si está mal formado
+        if restante > maximo:
+            raise CuerpoDemasiadoGrande()
+        while restante > 0:
+            bloque = self.rfile.read(min(TAM_BLOQUE, restante))
+            if not bloque:
+                break
+            partes.append(bloque)
+            restante -= len(bloque)
+        return b"".join(partes)
+
+    # ---------- Endpoints ----------
+    def do_GET(self):
+        ruta = urlparse(self.path).path
+        if ruta == "/salud":
+            self._responder_json(200, {"estado": "ok", **self.gestor.resumen()})
+        elif ruta == "/metrics":
+            cuerpo = REGISTRO.exportar().encode("utf-8")
+            self._responder(200, cuerpo, "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self._responder_json(404, {"error": "No encontrado"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/convertir":
+            self._responder_json(404, {"error": "No encontrado"})
+            return
+
+        # Límite de peticiones simultáneas: mejor un 503 rápido que latencia sin control
+        if not self.limite.acquire(blocking=False):
+            self._responder_json(503, {"error": "Demasiadas peticiones simultáneas"}, {"Retry-After": "5"})
+            return
+        try:
+            self._convertir(url)
+        finally:
+            self.limite.release()
+
+    def _convertir(self, url):
+        params = parse_qs(url.query)
+        formato = params.get("formato", ["json"])[0]
+        nombre_pdf = params.get("nombre", ["pedido.pdf"])[0]
+        if formato != "json" and formato not in FORMATOS:
+            self._responder_json(400, {"error": f"Formato no soportado: {formato}"})
+            return
+        if not NOMBRE_VALIDO.match(nombre_pdf):
+            self._responder_json(400, {"error": "Nombre de fichero no válido"})
+            return
+
+        autorizacion = self.headers.get("Authorization", "")
+        if not autorizacion.startswith("Bearer "):
+            self._responder_json(401, {"error": "Falta la cabecera Authorization: Bearer <token>"})
+            return
+        access_token = autorizacion[len("Bearer "):]
+
+        try:
+            pdf_bytes = self._leer_cuerpo()
+        except CuerpoDemasiadoGrande:
+            self._responder_json(413, {"error": f"El PDF supera {SERVICIO_MAX_MB} MB"})
+            return
+        except ValueError:
+            self._responder_json(400, {"error": "Content-Length o tamaño de bloque no válido"})
+            return
+        if not pdf_bytes.startswith(b"%PDF"):
+            self._responder_json(400, {"error": "El cuerpo no es un PDF"})
+            return
+
+        try:
+            if formato == "xlsx":
+                trabajo_id = self.gestor.enviar(convertir_pdf, pdf_bytes, nombre_pdf, access_token)
+            else:
+                trabajo_id = self.gestor.enviar(convertir_pdf_filas, pdf_bytes, access_token)
+        except ColaLlena as e:
+            self._responder_json(503, {"error": str(e), "pendientes": e.pendientes}, {"Retry-After": "5"})
+            return
+
+        trabajo = self.gestor.esperar(trabajo_id)
+        if trabajo.estado != COMPLETADO:
+            codigo = 504 if trabajo.estado == TIEMPO_AGOTADO else 500
+            self._responder_json(codigo, {"error": trabajo.error or trabajo.estado})
+            return
+
+        *resultado, aviso = trabajo.resultado
+        if aviso:
+            # Sin Orden Maestra las líneas saldrían sin ordenar: no se devuelve como un éxito
+            self._responder_json(502, {"error": aviso})
+            return
+
+        if formato == "xlsx":
+            contenido, nombre_final = resultado
+            self._responder(200, contenido, MIME["xlsx"], {"Content-Disposition": _adjunto(nombre_final)})
+        elif formato == "json":
+            self._responder_json(200, {"columnas": COLUMNAS, "filas": resultado[0]})
+        else:
+            self._responder(200, serializar(resultado[0], formato), MIME[formato], {
+                "Content-Disposition": _adjunto(nombre_salida(nombre_pdf, formato))
+            })
+
+    def log_message(self, formato, *args):
+        print(f"[servicio_http] {self.address_string()} - {formato % args}")
+
+
+def crear_servidor(host: str, puerto: int, gestor: GestorTrabajos = None) -> ThreadingHTTPServer:
+    """Sin `gestor` se crea un pool propio, independiente del de la UI."""
+    ManejadorConversion.gestor = gestor or GestorTrabajos()
+    ManejadorConversion.limite = threading.BoundedSemaphore(SERVICIO_MAX_CONCURRENTES)
+    return ThreadingHTTPServer((host, puerto), ManejadorConversion)
+
+
+def iniciar_en_app():
+    """
+    Arranca (una sola vez por proceso) el servicio en un hilo del proceso de Streamlit
+    si SERVICIO_PUERTO está definido, usando el mismo GestorTrabajos que la UI.
+    """
+    global _servicio_iniciado
+    if not SERVICIO_PUERTO:
+        return
+    with _lock_servicio:
+        if _servicio_iniciado:
+            return
+        _servicio_iniciado = True
+
+    from trabajos import obtener_gestor
+    servidor = crear_servidor("0.0.0.0", int(SERVICIO_PUERTO), gestor=obtener_gestor())
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio HTTP de conversión de pedidos ET")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--puerto", type=int, default=8080)
+    args = parser.parse_args()
+
+    servidor = crear_servidor(args.host, args.puerto)
+    print(f"Escuchando en http://{args.host}:{args.puerto}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        ManejadorConversion.gestor.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+# trabajos.py
+import os
+import time
+import uuid
+import atexit
+import shutil
+import signal
+import tempfile
+import threading
+import multiprocessing as mp
+from collections import deque
+from multiprocessing.connection import wait
+import streamlit as st
+from extraer_tabla import (
+    procesar_pedido,
+    generar_excel,
+    nombre_excel
+)
+from metricas import REGISTRO
+
+# ---- Configuración del pool (se puede ajustar por variables de entorno) ----
+TRABAJOS_WORKERS   = int(os.getenv("TRABAJOS_WORKERS", "2"))      # procesos trabajadores
+TRABAJOS_COLA_MAX  = int(os.getenv("TRABAJOS_COLA_MAX", "8"))     # trabajos en espera como máximo
+TRABAJOS_TIMEOUT   = float(os.getenv("TRABAJOS_TIMEOUT", "180"))  # segundos por trabajo
+TRABAJOS_RETENCION = 600  # segundos que se conserva un trabajo terminado para consultarlo
+
+# Estados de un trabajo
+PENDIENTE      = "pendiente"
+EN_CURSO       = "en_curso"
+COMPLETADO     = "completado"
+ERROR          = "error"
+CANCELADO      = "cancelado"
+TIEMPO_AGOTADO = "tiempo_agotado"
+TERMINADOS = (COMPLETADO, ERROR, CANCELADO, TIEMPO_AGOTADO)
+
+
+class ColaLlena(Exception):
+    """Se lanza al enviar un trabajo cuando la cola ya está llena."""
+
+    def __init__(self, pendientes: int):
+        super().__init__(f"Cola llena, {pendientes} trabajos por delante")
+        self.pendientes = pendientes
+
+
+def convertir_pdf(pdf_bytes: bytes, nombre_pdf: str, access_token: str) -> tuple:
+    """
+    Convierte el PDF en un proceso trabajador y devuelve (bytes del Excel, nombre, aviso).
+    `aviso` no es None si las líneas no se pudieron ordenar (ver procesar_pedido).
+    """
+    df, _, _, aviso = procesar_pedido(pdf_bytes, access_token)
+    return generar_excel(df).getvalue(), nombre_excel(nombre_pdf), aviso
+
+
+def convertir_pdf_pedido(pdf_bytes: bytes, nombre_pdf: str, access_token: str) -> dict:
+    """
+    Como `convertir_pdf`, pero devuelve también los datos del pedido para guardarlo
+    en el almacén: {"excel", "nombre", "pedido", "tienda", "filas", "aviso"}.
+    `aviso` no es None si las líneas no se pudieron ordenar (ver procesar_pedido).
+    """
+    df, valor_pedido, tienda, aviso = procesar_pedido(pdf_bytes, access_token)
+    return {
+        "excel": generar_excel(df).getvalue(),
+        "nombre": nombre_excel(nombre_pdf),
+        "pedido": valor_pedido,
+        "tienda": tienda,
+        "filas": df.to_dict(orient="records"),
+        "aviso": aviso,
+    }
+
+
+def convertir_pdf_filas(pdf_bytes: bytes, access_token: str) -> tuple:
+    """Como `convertir_pdf`, pero devuelve (filas ordenadas como lista de diccionarios, aviso)."""
+    df, _, _, aviso = procesar_pedido(pdf_bytes, access_token)
+    return df.to_dict(orient="records"), aviso
+
+
+def _bucle_worker(conn, directorio_tmp: str):
+    """
+    Bucle de cada proceso trabajador: recibe (objetivo, args) y devuelve (ok, valor, métricas),
+    donde métricas es lo acumulado en el registro del proceso durante el trabajo.
+
+    El trabajador encabeza su propio grupo de procesos y crea sus temporales en
+    `directorio_tmp`: si el gestor lo mata (cancelación o timeout) mata con él a los
+    procesos que haya lanzado (extracción por páginas) y borra lo que dejó a medias.
+    """
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    tempfile.tempdir = directorio_tmp
+    while True:
+        try:
+            tarea = conn.recv()
+        except EOFError:
+            break
+        if tarea is None:
+            break
+
+        objetivo, args = tarea
+        try:
+            ok, valor = True, objetivo(*args)
+        except Exception as e:
+            ok, valor = False, f"{type(e).__name__}: {e}"
+        conn.send((ok, valor, REGISTRO.volcar(reiniciar=True)))
+
+
+class Trabajo:
+    def __init__(self, objetivo, args, timeout):
+        self.id = uuid.uuid4().hex
+        self.objetivo = objetivo
+        self.args = args
+        self.timeout = timeout
+        self.estado = PENDIENTE
+        self.resultado = None
+        self.error = None
+        self.creado = time.monotonic()
+        self.inicio = None
+        self.fin = None
+
+
+class _Trabajador:
+    def __init__(self, ctx):
+        self.conn, extremo_hijo = ctx.Pipe()
+        self.directorio_tmp = tempfile.mkdtemp(prefix="trabajador_")
+        # No daemon: el trabajador puede necesitar lanzar sus propios procesos
+        self.proceso = ctx.Process(
+            target=_bucle_worker, args=(extremo_hijo, self.directorio_tmp), daemon=False
+        )
+        self.proceso.start()
+        extremo_hijo.close()
+        self.trabajo = None
+
+    def _matar(self):
+        # Todo el grupo: sus hijos no ven EOF al morir el trabajador y quedarían huérfanos
+        try:
+            os.killpg(self.proceso.pid, signal.SIGKILL)
+        except (AttributeError, ProcessLookupError, PermissionError):
+            self.proceso.kill()
+
+    def detener(self, forzar: bool = False):
+        if forzar:
+            self._matar()
+        else:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                self._matar()
+        self.proceso.join(timeout=5)
+        if self.proceso.is_alive():
+            self._matar()
+            self.proceso.join(timeout=5)
+        self.conn.close()
+        shutil.rmtree(self.directorio_tmp, ignore_errors=True)
+
+
+class GestorTrabajos:
+    """
+    Cola acotada de trabajos de conversión repartidos en un pool de procesos.
+    - enviar(): encola un trabajo y devuelve su id (lanza ColaLlena si no hay hueco).
+    - estado()/posicion(): permiten a la UI consultar el trabajo sin bloquear.
+    - cancelar(): retira un trabajo en espera o mata el proceso que lo ejecuta.
+    Los trabajos que superan su timeout se abortan y el proceso se reemplaza.
+    """
+
+    def __init__(
+        self,
+        workers: int = TRABAJOS_WORKERS,
+        cola_max: int = TRABAJOS_COLA_MAX,
+        timeout: float = TRABAJOS_TIMEOUT
+    ):
+        self.cola_max = cola_max
+        self.timeout = timeout
+        self._ctx = mp.get_context("spawn")
+        self._cola = deque()
+        self._trabajos = {}
+        self._cond = threading.Condition()
+        self._activo = True
+        self._trabajadores = [_Trabajador(self._ctx) for _ in range(max(1, workers))]
+        self._hilo = threading.Thread(target=self._supervisar, daemon=True)
+        self._hilo.start()
+        atexit.register(self.cerrar)
+
+    # ---------- API pública ----------
+    def enviar(self, objetivo, *args, timeout: float = None) -> str:
+        with self._cond:
+            if len(self._cola) >= self.cola_max:
+                raise ColaLlena(len(self._cola) + self._ocupados())
+            trabajo = Trabajo(objetivo, args, timeout or self.timeout)
+            self._trabajos[trabajo.id] = trabajo
+            self._cola.append(trabajo)
+            self._asignar()
+            return trabajo.id
+
+    def estado(self, trabajo_id: str):
+        with self._cond:
+            return self._trabajos.get(trabajo_id)
+
+    def posicion(self, trabajo_id: str) -> int:
+        """Número de trabajos en cola por delante del indicado (0 si ya se está ejecutando)."""
+        with self._cond:
+            for i, trabajo in enumerate(self._cola):
+                if trabajo.id == trabajo_id:
+                    return i
+            return 0
+
+    def resumen(self) -> dict:
+        """Ocupación actual del pool, útil para health checks."""
+        with self._cond:
+            return {
+                "workers": len(self._trabajadores),
+                "ocupados": self._ocupados(),
+                "en_cola": len(self._cola),
+                "cola_max": self.cola_max,
+            }
+
+    def cancelar(self, trabajo_id: str) -> bool:
+        with self._cond:
+            trabajo = self._trabajos.get(trabajo_id)
+            if trabajo is None or trabajo.estado in TERMINADOS:
+                return False
+            if trabajo.estado == PENDIENTE:
+                self._cola.remove(trabajo)
+            # Si está en curso, el supervisor mata el proceso en su siguiente vuelta
+            self._terminar(trabajo, CANCELADO)
+            self._cond.notify_all()
+            return True
+
+    def esperar(self, trabajo_id: str, timeout: float = None):
+        """Bloquea hasta que el trabajo termina (o vence `timeout`) y lo devuelve."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                trabajo = self._trabajos.get(trabajo_id)
+                if trabajo is None or trabajo.estado in TERMINADOS:
+                    return trabajo
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return trabajo
+                self._cond.wait(restante)
+
+    def cerrar(self):
+        with self._cond:
+            if not self._activo:
+                return
+            self._activo = False
+            for trabajo in list(self._cola):
+                self._terminar(trabajo, CANCELADO)
+            self._cola.clear()
+            self._cond.notify_all()
+        for trabajador in self._trabajadores:
+            trabajador.detener(forzar=trabajador.trabajo is not None)
+
+    # ---------- Internos (se llaman con el lock tomado) ----------
+    def _ocupados(self) -> int:
+        return sum(1 for t in self._trabajadores if t.trabajo is not None)
+
+    def _asignar(self):
+        for trabajador in self._trabajadores:
+            if not self._cola:
+                return
+            if trabajador.trabajo is not None:
+                continue
+            trabajo = self._cola.popleft()
+            trabajo.estado = EN_CURSO
+            trabajo.inicio = time.monotonic()
+            trabajador.trabajo = trabajo
+            try:
+                trabajador.conn.send((trabajo.objetivo, trabajo.args))
+            except (BrokenPipeError, OSError):
+                self._terminar(trabajo, ERROR, "El proceso trabajador no está disponible")
+                self._reemplazar(trabajador)
+
+    def _terminar(self, trabajo, estado, error=None, resultado=None):
+        trabajo.estado = estado
+        trabajo.error = error
+        trabajo.resultado = resultado
+        trabajo.args = None  # libera los bytes del PDF
+        trabajo.fin = time.monotonic()
+
+    def _reemplazar(self, trabajador):
+        trabajador.trabajo = None
+        trabajador.detener(forzar=True)
+        idx = self._trabajadores.index(trabajador)
+        self._trabajadores[idx] = _Trabajador(self._ctx)
+
+    def _supervisar(self):
+        while self._activo:
+            with self._cond:
+                ocupados = {t.conn: t for t in self._trabajadores if t.trabajo is not None}
+                if not ocupados:
+                    self._cond.wait(0.2)
+
+            listos = wait(list(ocupados), timeout=0.2) if ocupados else []
+
+            with self._cond:
+                if not self._activo:
+                    return
+
+                # 1) Resultados recibidos
+                for conn in listos:
+                    trabajador = ocupados[conn]
+                    trabajo = trabajador.trabajo
+                    try:
+                        ok, valor, metricas = conn.recv()
+                        REGISTRO.fusionar(metricas)
+                        caido = False
+                    except (EOFError, OSError):
+                        ok, valor, caido = False, "El proceso trabajador terminó inesperadamente", True
+
+                    if trabajo is not None and trabajo.estado == EN_CURSO:
+                        if ok:
+                            self._terminar(trabajo, COMPLETADO, resultado=valor)
+                        else:
+                            self._terminar(trabajo, ERROR, error=valor)
+                    trabajador.trabajo = None
+                    if caido:
+                        self._reemplazar(trabajador)
+
+                # 2) Cancelaciones, timeouts y procesos caídos
+                ahora = time.monotonic()
+                for trabajador in list(self._trabajadores):
+                    trabajo = trabajador.trabajo
+                    if trabajo is None:
+                        if not trabajador.proceso.is_alive():
+                            self._reemplazar(trabajador)
+                        continue
+                    if trabajo.estado == EN_CURSO and ahora - trabajo.inicio > trabajo.timeout:
+                        self._terminar(
+                            trabajo, TIEMPO_AGOTADO,
+                            error=f"El trabajo superó el límite de {trabajo.timeout:.0f} s"
+                        )
+                    if trabajo.estado != EN_CURSO:
+                        self._reemplazar(trabajador)
+
+                # 3) Purga de trabajos antiguos ya terminados
+                for trabajo_id, trabajo in list(self._trabajos.items()):
+                    if trabajo.fin is not None and ahora - trabajo.fin > TRABAJOS_RETENCION:
+                        del self._trabajos[trabajo_id]
+
+                self._asignar()
+                self._cond.notify_all()
+
+
+@st.cache_resource
+def obtener_gestor() -> GestorTrabajos:
+    """Gestor único por servidor, compartido por todas las sesiones de Streamlit."""
+    return GestorTrabajos()
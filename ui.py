@@ -1,31 +1,52 @@
 import base64
+import time
 import streamlit as st
 import logging
 from auth import iniciar_autenticacion, cerrar_sesion
-from extraer_tabla import procesar_pdf
+from trabajos import (
+    obtener_gestor,
+    convertir_pdf_pedido,
+    ColaLlena,
+    PENDIENTE,
+    EN_CURSO,
+    COMPLETADO,
+    TIEMPO_AGOTADO
+)
 from datetime import datetime
 import pandas as pd
 from io import BytesIO
 from exportacion_plantilla import (
     limpiar_entradas_xlwings,
     exportar_directo_excel_xlwings,
-    subir_a_sharepoint
+    subir_a_sharepoint,
+    RUTA_PLANTILLA,
+    COLUMNAS_PLANTILLA
 )
+from cache_salidas import obtener_cache_salidas, hash_filas_excel
+from almacen_pedidos import obtener_almacen, hash_pdf
+from formatos_salida import FORMATOS, MIME, serializar, nombre_salida
 
 def init_state():
     defaults = {
         "last_pdf_key": None,            # identifica si el PDF es nuevo
         "export_done": False,            # ya se volcó a Excel este PDF
         "excel_final_bytes": None,       # bytes del xlsm actualizado para descargar
-        "uploaded_to_sharepoint": False  # ya se subió a SharePoint
+        "uploaded_to_sharepoint": False, # ya se subió a SharePoint
+        "trabajo_id": None,              # id del trabajo de conversión en la cola
+        "excel_bytes": None,             # bytes del Excel generado por el trabajo
+        "excel_nombre": None,            # nombre del Excel generado por el trabajo
+        "pdf_hash": None,                # sha256 del PDF (clave en el almacén de pedidos)
+        "pedido_info": None,             # pedido/tienda extraídos del PDF
+        "pedido_reutilizado": None,      # fecha en que se procesó antes, si venía del almacén
+        "filas_pedido": None,            # filas ordenadas (COLUMNAS) para descargar en otros formatos
+        "aviso_orden": None,             # motivo por el que las líneas no se ordenaron, si lo hay
+        "datos_descarga": {}             # formato → filas_pedido ya serializadas para descargar
     }
     for k, v in defaults.items():
         if k not in st.session_state:
             st.session_state[k] = v
 
 
-RUTA_PLANTILLA = "SaeGA v2.0.2 - Plantilla - copia para Importador de Pedidos - copia.xlsm"
-
 APP_TITLE   = "Convertidor Pedidos ET → Excel"
 APP_VERSION = "0.3.16"
 
@@ -255,6 +276,182 @@ def mostrar_login():
 
     render_footer()
 
+def obtener_excel_convertido(pdf_file):
+    """
+    Envía el PDF a la cola de trabajos y consulta su estado en cada rerun.
+    Devuelve los bytes del Excel cuando el trabajo termina bien; mientras tanto
+    muestra la posición en la cola y vuelve a ejecutar el script cada segundo.
+    """
+    almacen = obtener_almacen()
+    if st.session_state.pdf_hash is None:
+        st.session_state.pdf_hash = hash_pdf(pdf_file.getvalue())
+        # PDF ya conocido: se devuelve lo guardado sin volver a parsearlo
+        guardado = almacen.obtener(st.session_state.pdf_hash)
+        if guardado is not None and guardado["excel"]:
+            st.session_state.excel_bytes = guardado["excel"]
+            st.session_state.excel_nombre = guardado["excel_nombre"]
+            st.session_state.pedido_info = {"pedido": guardado["pedido"], "tienda": guardado["tienda"]}
+            st.session_state.pedido_reutilizado = guardado["fecha"]
+            st.session_state.filas_pedido = guardado["filas"]
+            st.session_state.datos_descarga = {}
+
+    if st.session_state.pedido_reutilizado:
+        st.info(f"♻️ Este PDF ya se procesó el {st.session_state.pedido_reutilizado}; se reutiliza el resultado guardado.")
+
+    if st.session_state.aviso_orden:
+        st.warning(f"⚠️ {st.session_state.aviso_orden}")
+
+    if st.session_state.excel_bytes is not None:
+        return st.session_state.excel_bytes
+
+    gestor = obtener_gestor()
+    if st.session_state.trabajo_id is None:
+        try:
+            st.session_state.trabajo_id = gestor.enviar(
+                convertir_pdf_pedido,
+                pdf_file.getvalue(),
+                pdf_file.name,
+                st.session_state.access_token
+            )
+        except ColaLlena as e:
+            # Backpressure: no encolamos más, reintentamos en unos segundos
+            st.warning(f"⏳ Servidor ocupado: cola llena, {e.pendientes} trabajos por delante. Reintentando…")
+            time.sleep(3)
+            st.rerun()
+
+    trabajo = gestor.estado(st.session_state.trabajo_id)
+    if trabajo is None:
+        # El trabajo ya se purgó (p. ej. sesión inactiva mucho tiempo): se vuelve a enviar
+        st.session_state.trabajo_id = None
+        st.rerun()
+
+    if trabajo.estado in (PENDIENTE, EN_CURSO):
+        if trabajo.estado == PENDIENTE:
+            st.info(f"⏳ En cola, {gestor.posicion(trabajo.id)} trabajos por delante…")
+        else:
+            st.info("⚙️ Procesando el PDF…")
+        if st.button("Cancelar conversión"):
+            gestor.cancelar(trabajo.id)
+        time.sleep(1)
+        st.rerun()
+
+    if trabajo.estado == COMPLETADO:
+        resultado = trabajo.resultado
+        if resultado["aviso"]:
+            # Sin ordenar no se guarda: la próxima vez que se suba el PDF se vuelve a intentar
+            st.session_state.aviso_orden = resultado["aviso"]
+            st.warning(f"⚠️ {resultado['aviso']}")
+        else:
+            almacen.guardar(st.session_state.pdf_hash, pdf_file.name, resultado)
+        st.session_state.excel_bytes = resultado["excel"]
+        st.session_state.excel_nombre = resultado["nombre"]
+        st.session_state.pedido_info = {"pedido": resultado["pedido"], "tienda": resultado["tienda"]}
+        st.session_state.filas_pedido = resultado["filas"]
+        st.session_state.datos_descarga = {}
+        return st.session_state.excel_bytes
+
+    if trabajo.estado == TIEMPO_AGOTADO:
+        raise TimeoutError(trabajo.error)
+    if trabajo.error:
+        raise RuntimeError(trabajo.error)
+
+    st.warning("🛑 Conversión cancelada.")
+    if st.button("Reintentar"):
+        st.session_state.trabajo_id = None
+        st.rerun()
+    return None
+
+def subida_permitida(file_name_final: str) -> bool:
+    """
+    Evita subir dos veces el mismo pedido a SharePoint: si este PDF ya se subió
+    con ese nombre no se repite, y si el mismo número de pedido se subió desde
+    otro PDF se pide confirmación.
+    """
+    almacen = obtener_almacen()
+    if almacen.obtener_subida(st.session_state.pdf_hash) == file_name_final:
+        st.success(f"✅ Este pedido ya está subido a SharePoint como «{file_name_final}».")
+        return False
+
+    pedido = (st.session_state.pedido_info or {}).get("pedido")
+    previos = almacen.subidas_previas(st.session_state.pdf_hash, pedido)
+    if previos:
+        st.warning(
+            f"⚠️ El pedido {pedido} ya se subió el {previos[0]['fecha_subida']} "
+            f"como «{previos[0]['subido_como']}»."
+        )
+        return st.checkbox("Subirlo de nuevo igualmente", key=f"resubir_{st.session_state.pdf_hash}")
+    return True
+
+def mostrar_descarga_datos(nombre_pdf: str):
+    """Descarga de las filas extraídas en el formato elegido (xlsx, csv, jsonl o parquet)."""
+    if not st.session_state.filas_pedido:
+        return
+    col_formato, col_boton = st.columns([1, 1])
+    with col_formato:
+        formato = st.selectbox("Formato de los datos", FORMATOS, key="formato_datos")
+    # Se serializa una sola vez por formato y sesión; se descarta junto con filas_pedido
+    if formato not in st.session_state.datos_descarga:
+        st.session_state.datos_descarga[formato] = serializar(st.session_state.filas_pedido, formato)
+    with col_boton:
+        st.download_button(
+            "📥 Descargar datos",
+            data=st.session_state.datos_descarga[formato],
+            file_name=nombre_salida(nombre_pdf, formato),
+            mime=MIME[formato],
+            key=f"dl_datos_{st.session_state.last_pdf_key}"
+        )
+
+def mostrar_historial():
+    """Buscador de pedidos ya procesados con descarga directa de sus ficheros."""
+    with st.expander("🔎 Pedidos procesados"):
+        col1, col2, col3 = st.columns([1, 1, 2])
+        with col1:
+            pedido = st.text_input("Pedido", key="hist_pedido")
+        with col2:
+            tienda = st.text_input("Tienda", key="hist_tienda")
+        with col3:
+            fechas = st.date_input("Fechas", value=(), key="hist_fechas")
+
+        desde = fechas[0] if len(fechas) > 0 else None
+        hasta = fechas[1] if len(fechas) > 1 else desde
+        almacen = obtener_almacen()
+        resultados = almacen.buscar(pedido=pedido, tienda=tienda, desde=desde, hasta=hasta, limite=20)
+        if not resultados:
+            st.caption("No hay pedidos que coincidan.")
+            return
+
+        # Los ficheros solo se leen del almacén para el pedido que se elige (pesan varios MB)
+        seleccionado = st.session_state.get("hist_seleccion")
+        for r in resultados:
+            col_info, col_excel, col_plantilla = st.columns([3, 1, 1])
+            with col_info:
+                subido = f" · subido como «{r['subido_como']}»" if r["subido_como"] else ""
+                st.markdown(f"**PC{r['pedido']}** · tienda {r['tienda'] or '-'} · {r['fecha']}{subido}  \n"
+                            f"<small>{r['nombre_pdf']}</small>", unsafe_allow_html=True)
+            if r["pdf_hash"] != seleccionado:
+                with col_excel:
+                    if st.button("📂 Preparar descarga", key=f"hist_preparar_{r['pdf_hash']}"):
+                        st.session_state.hist_seleccion = r["pdf_hash"]
+                        st.rerun()
+                continue
+            with col_excel:
+                st.download_button(
+                    "📥 Excel",
+                    data=almacen.obtener_artefacto(r["pdf_hash"], "excel"),
+                    file_name=r["excel_nombre"],
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    key=f"hist_excel_{r['pdf_hash']}"
+                )
+            with col_plantilla:
+                if r["tiene_plantilla"]:
+                    st.download_button(
+                        "📥 SaeGA",
+                        data=almacen.obtener_artefacto(r["pdf_hash"], "plantilla"),
+                        file_name=r["subido_como"] or f"PC{r['pedido']} - SaeGA.xlsm",
+                        mime="application/vnd.ms-excel.sheet.macroEnabled.12",
+                        key=f"hist_plantilla_{r['pdf_hash']}"
+                    )
+
 def mostrar_aplicacion():
     inject_styles()
     init_state()
@@ -271,23 +468,31 @@ def mostrar_aplicacion():
     if pdf_file is not None:
         pdf_key = f"{pdf_file.name}-{getattr(pdf_file, 'size', 0)}"
         if st.session_state.last_pdf_key != pdf_key:
+            if st.session_state.trabajo_id is not None:
+                # El PDF anterior ya no interesa: libera su hueco en la cola o su proceso
+                obtener_gestor().cancelar(st.session_state.trabajo_id)
             st.session_state.last_pdf_key = pdf_key
             st.session_state.export_done = False
             st.session_state.excel_final_bytes = None
             st.session_state.uploaded_to_sharepoint = False
+            st.session_state.trabajo_id = None
+            st.session_state.excel_bytes = None
+            st.session_state.excel_nombre = None
+            st.session_state.pdf_hash = None
+            st.session_state.pedido_info = None
+            st.session_state.pedido_reutilizado = None
+            st.session_state.filas_pedido = None
+            st.session_state.datos_descarga = {}
+            st.session_state.aviso_orden = None
 
     st.markdown('</div>', unsafe_allow_html=True)
 
     if pdf_file is not None:
         with st.spinner("Extrayendo datos, dame unos segundos…"):
             try:
-                output_excel, nombre_archivo = procesar_pdf(pdf_file, pdf_file.name, st.session_state.access_token)
-
-                output_excel.seek(0)  # Asegurarse de que el puntero esté al inicio
-                bytes_data = output_excel.getvalue()  # guardamos el contenido en memoria
-                output_excel.close()    
-
-                st.success("✅ ¡PDF procesado!")
+                bytes_data = obtener_excel_convertido(pdf_file)
+                if bytes_data:
+                    st.success("✅ ¡PDF procesado!")
 
                 '''                
                 col6, col7, col8 = st.columns([1, 1, 1])
@@ -315,6 +520,7 @@ def mostrar_aplicacion():
                     st.markdown("#### 📋 Vista previa de los datos extraidos")
                     st.dataframe(df_preview, use_container_width=True)
                     st.markdown('</div>', unsafe_allow_html=True)       
+                    mostrar_descarga_datos(pdf_file.name)
                 except Exception as e:
                     st.warning("⚠️ No se pudo mostrar la vista previa de los datos.")
                     logging.exception(f"[{datetime.now()}] Error mostrando vista previa: {e}")
@@ -334,41 +540,52 @@ def mostrar_aplicacion():
             if 'bytes_data' in locals() and bytes_data and numero_usuario:
                 try:
                     if not st.session_state.get("export_done"):
-                        with st.spinner("Limpiando plantilla…"):
-                            # Limpia A/B/C desde fila 3. Si quieres dejar sólo 1 fila en la tabla: ajustar_filas=True
-                            limpiar_entradas_xlwings(
-                                RUTA_PLANTILLA,
-                                hoja="Pedidos",
-                                nombre_tabla="tblPedidos",
-                                col_inicio="A",
-                                col_fin="C",
-                                ajustar_filas=True 
-                            )
-
-
-                        with st.spinner("Volcando datos en la plantilla local…"):
-                            exportar_directo_excel_xlwings(
-                                RUTA_PLANTILLA,
-                                bytes_data,
-                                hoja="Pedidos",
-                                nombre_tabla="tblPedidos",
-                                columnas_df=("Tienda", "Código", "Cantidad"),
-                            )
-
-                        # Guarda bytes para reusar en descargas posteriores (sin re-escribir)
-                        with open(RUTA_PLANTILLA, "rb") as f:
-                            st.session_state.excel_final_bytes = f.read()
+                        # Si ya se generó la plantilla para estas mismas filas, se reutiliza
+                        cache = obtener_cache_salidas()
+                        base_plantilla = cache.base_plantilla(RUTA_PLANTILLA)
+                        clave_cache = cache.clave(base_plantilla, hash_filas_excel(bytes_data, COLUMNAS_PLANTILLA))
+                        st.session_state.excel_final_bytes = cache.obtener(clave_cache)
+                        if st.session_state.excel_final_bytes is None:
+                            with st.spinner("Limpiando plantilla…"):
+                                # Limpia A/B/C desde fila 3. Si quieres dejar sólo 1 fila en la tabla: ajustar_filas=True
+                                limpiar_entradas_xlwings(
+                                    RUTA_PLANTILLA,
+                                    hoja="Pedidos",
+                                    nombre_tabla="tblPedidos",
+                                    col_inicio="A",
+                                    col_fin="C",
+                                    ajustar_filas=True 
+                                )
+
+
+                            with st.spinner("Volcando datos en la plantilla local…"):
+                                exportar_directo_excel_xlwings(
+                                    RUTA_PLANTILLA,
+                                    bytes_data,
+                                    hoja="Pedidos",
+                                    nombre_tabla="tblPedidos",
+                                    columnas_df=COLUMNAS_PLANTILLA,
+                                )
+
+                            # Guarda bytes para reusar en descargas posteriores (sin re-escribir)
+                            with open(RUTA_PLANTILLA, "rb") as f:
+                                st.session_state.excel_final_bytes = f.read()
+                            cache.guardar(clave_cache, st.session_state.excel_final_bytes, base_plantilla)
+
+                        obtener_almacen().guardar_plantilla(st.session_state.pdf_hash, st.session_state.excel_final_bytes)
                         st.session_state.export_done = True
 
                     plantilla_bytes = st.session_state.excel_final_bytes
                     file_name_final = f"{numero_usuario} - SaeGA.xlsm"
 
-                    # Subir a SharePoint con los bytes ya guardados (no re-escribe)
-                    exito = subir_a_sharepoint(BytesIO(plantilla_bytes), file_name_final, st.session_state.access_token)
-                    if exito:
-                        st.success("✅ Archivo subido correctamente a SharePoint")
-                    else:
-                        st.error("❌ No se pudo subir el archivo a SharePoint, 👀 ojo a no tener ese archivo abierto en SharePoint.")
+                    # Subir a SharePoint con los bytes ya guardados (no re-escribe), una sola vez por pedido
+                    if subida_permitida(file_name_final):
+                        exito = subir_a_sharepoint(BytesIO(plantilla_bytes), file_name_final, st.session_state.access_token)
+                        if exito:
+                            obtener_almacen().marcar_subido(st.session_state.pdf_hash, file_name_final)
+                            st.success("✅ Archivo subido correctamente a SharePoint")
+                        else:
+                            st.error("❌ No se pudo subir el archivo a SharePoint, 👀 ojo a no tener ese archivo abierto en SharePoint.")
 
                     # Descargar (sin re-escribir)
                     col6, col7, col8 = st.columns([1, 1, 1])
@@ -390,5 +607,5 @@ def mostrar_aplicacion():
                         st.code(str(e))
                     logging.exception(f"[{datetime.now()}] Error en exportación plantilla in-place: {e}")
 
-
+    mostrar_historial()
     render_footer()